@@ -1,11 +1,8 @@
 from __future__ import annotations
 
-import hashlib
-import tempfile
 import uuid
 from pathlib import Path
 
-import cv2
 import numpy as np
 import streamlit as st
 from PIL import Image
@@ -13,19 +10,26 @@ from PIL import Image
 from app_pages.patients import render_patient_search
 from database.db import (
     create_study,
+    save_study_features,
     update_study_image_path,
     update_study_ml_result,
     update_study_report,
 )
-from ml_model.rf_inference import load_rf_model, predict_from_image_path_with_model
+from image_processing.pipeline import PIPELINE_CACHE, PIPELINE_VERSION, content_hash
+from ml_model.rf_inference import (
+    DECODE_MIN_SIZE,
+    decode_gray_image_bytes,
+    load_rf_model,
+    predict_from_image_path_with_model,
+)
 
 from compression.huffman_codec import compress_image_to_huf_file
 
-from image_processing.preprocess import preprocess_rx
-from image_processing.segmentation import segment_lungs
 
 MODEL_PATH = Path("ml_model/modelo_random_forest_final.pkl")
 OUTPUT_DIR = Path("outputs/images")
+# Resolución mínima de la vista previa: los JPEG más grandes se decodifican reducidos
+PREVIEW_MIN_SIZE = (1024, 1024)
 
 
 @st.cache_resource
@@ -179,28 +183,21 @@ def render_diagnosis() -> None:
 
     if uploaded:
         file_bytes = uploaded.getvalue()
-        file_hash = hashlib.md5(file_bytes).hexdigest()
+        file_hash = content_hash(file_bytes)
 
-        # Recalcular solo si cambió el archivo
+        # Recalcular solo si cambió el archivo; el resultado queda en PIPELINE_CACHE
+        # y "Ejecutar modelo" lo reutiliza (mismo contenido = mismo hash)
         if st.session_state.get("proc_preview_hash") != file_hash:
             with st.spinner("Generando vista del procesamiento..."):
-                suffix = Path(uploaded.name).suffix.lower() or ".jpg"
-                with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                    tmp.write(file_bytes)
-                    tmp_path = Path(tmp.name)
-
-                # Cargar imagen a grayscale
-                img_np = np.array(Image.open(tmp_path).convert("L"), dtype=np.uint8)
-
-                img_prep = preprocess_rx(img_np)
-                mask = segment_lungs(img_prep)
-                img_roi = cv2.bitwise_and(img_prep, img_prep, mask=mask)
+                pipe = PIPELINE_CACHE.get(
+                    file_hash, lambda: decode_gray_image_bytes(file_bytes, min_size=DECODE_MIN_SIZE)
+                )
 
                 st.session_state["proc_preview_hash"] = file_hash
                 st.session_state["proc_preview"] = {
-                    "img_prep": img_prep,
-                    "mask": mask,
-                    "img_roi": img_roi,
+                    "img_prep": pipe.img_prep,
+                    "mask": pipe.mask,
+                    "img_roi": pipe.img_roi,
                 }
 
     study_id = st.session_state.get("current_study_id")
@@ -214,6 +211,7 @@ def render_diagnosis() -> None:
     with col_img:
         if uploaded:
             img = Image.open(uploaded)
+            img.draft(None, PREVIEW_MIN_SIZE)
             _render_preview(img, title=" ")
 
     with col_actions:
@@ -282,11 +280,6 @@ def render_diagnosis() -> None:
             st.error("No hay imagen asociada al estudio actual.")
             st.stop()
 
-        # El modelo trabaja con JPG/PNG; si ya se comprimió a .huf, no corre desde path.
-        if str(img_path_s).lower().endswith(".huf"):
-            st.error("Este estudio ya fue comprimido (.huf). No se puede correr el modelo desde un .huf.")
-            st.stop()
-
         try:
             clf = _get_rf_model()
             result = predict_from_image_path_with_model(Path(img_path_s), clf)
@@ -300,6 +293,8 @@ def render_diagnosis() -> None:
             model_score=result.score,
             updated_by_user_id=int(user["id"]),
         )
+        # El vector de features queda guardado para re-puntuar con otro modelo
+        save_study_features(int(study_id), PIPELINE_VERSION, result.features)
 
         st.success(f"✅ Resultado: **{result.label}** (score={result.score*100:.2f}%)")
 
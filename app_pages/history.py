@@ -4,11 +4,12 @@ import datetime as dt
 from pathlib import Path
 
 import streamlit as st
+import numpy as np
 from PIL import Image
 
 from app_pages.patients import render_patient_search, format_date_ddmmyyyy
 from database.db import list_studies_by_patient
-from compression.huffman_codec import decompress_huf_file_to_image
+from compression.huffman_codec import load_huf_image_cached
 
 
 def _fmt_datetime_sqlite(dt_str: str | None) -> str:
@@ -21,10 +22,18 @@ def _fmt_datetime_sqlite(dt_str: str | None) -> str:
         return dt_str
 
 
-def _render_study_image(img_path: str) -> None:
+def _to_display(img: np.ndarray) -> np.ndarray:
+    # st.image espera 8 bits; las imágenes de 12/16 bits se escalan por su máximo
+    if img.dtype == np.uint8 or img.size == 0:
+        return img
+    return (img.astype(np.float32) * (255.0 / max(1, int(img.max())))).astype(np.uint8)
+
+
+def _render_study_image(img_path: str, key: str) -> None:
     """
     Renderiza la imagen del estudio.
-    - Si es .huf: descomprime (Huffman) y muestra en escala de grises.
+    - Si es .huf: muestra la vista previa embebida (no decodifica la imagen
+      completa); la resolución completa se decodifica solo a pedido.
     - Si es JPG/PNG: abre con libreria PIL
     """
     p = Path(img_path) if img_path else None
@@ -36,14 +45,15 @@ def _render_study_image(img_path: str) -> None:
 
     try:
         if p.suffix.lower() == ".huf":
-            img = decompress_huf_file_to_image(p)
+            full = st.checkbox("Ver en resolución completa", key=f"hist_full_{key}")
+            img = load_huf_image_cached(p, preview=not full)
             st.image(
-                img,
+                _to_display(img),
                 use_container_width=True,
                 clamp=True,
                 channels="GRAY",
             )
-            st.caption(f"Imagen comprimida (Huffman .huf): {img_path}")
+            st.caption(f"Imagen comprimida (.huf{'' if full else ', vista previa'}): {img_path}")
         else:
             img_pil = Image.open(p)
             st.image(img_pil, use_container_width=True)
@@ -113,7 +123,7 @@ def render_history() -> None:
             c_img, c_info = st.columns([3, 2], gap="large")
 
             with c_img:
-                _render_study_image(img_path)
+                _render_study_image(img_path, key=str(study_id))
 
             with c_info:
                 st.markdown(f"**Fecha/hora:** {created_at}")
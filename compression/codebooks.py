@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from compression.huffman_core import (
+    MAX_CODE_LENGTH,
+    HuffmanTable,
+    canonical_codes,
+    code_lengths,
+    histograma,
+)
+from compression.prediction import residuals
+
+# Tablas de Huffman entrenadas con un corpus de estudios. Un archivo que usa una
+# guarda solo su id (chunk b"CBID", uint16) en lugar de los largos, así que los
+# ids no se reutilizan nunca: cambiar una tabla ya registrada rompe los archivos
+# que la referencian. Las tablas de la instalación están en CODEBOOKS_PATH.
+CODEBOOKS_PATH = Path(__file__).with_name("codebooks.json")
+
+
+class Codebook:
+    """
+    Tabla compartida: largos de código canónicos para todos los símbolos
+    0..n-1 (ninguno en 0, así sirve para cualquier imagen de ese alfabeto).
+    El modelo (códigos, largos) y las tablas de decodificación se arman una
+    vez por proceso.
+    """
+
+    def __init__(self, codebook_id: int, name: str, lengths):
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if not 0 < codebook_id <= 0xFFFF:
+            raise ValueError(f"Id de codebook fuera de rango: {codebook_id}.")
+        if lengths.size == 0 or np.any(lengths <= 0):
+            raise ValueError("Un codebook necesita un largo de código para cada símbolo.")
+        if np.sum(2.0 ** -lengths) > 1:
+            raise ValueError("Largos de código inválidos (no cumplen Kraft).")
+        self.codebook_id = int(codebook_id)
+        self.name = name
+        self.lengths = lengths
+        self.lengths.setflags(write=False)
+        self.model = (canonical_codes(lengths), lengths)
+        self._tables: Dict[np.dtype, HuffmanTable] = {}
+
+    @property
+    def max_length(self) -> int:
+        return int(self.lengths.max())
+
+    def table(self, dtype=np.uint8) -> HuffmanTable:
+        dtype = np.dtype(dtype)
+        if dtype not in self._tables:
+            self._tables[dtype] = HuffmanTable(*self.model, dtype=dtype)
+        return self._tables[dtype]
+
+    def cost_bits(self, hist: np.ndarray) -> Optional[int]:
+        """Bits del payload con esta tabla, o None si el histograma usa símbolos fuera del alfabeto."""
+        if hist.size > self.lengths.size:
+            if np.any(hist[self.lengths.size :]):
+                return None
+            hist = hist[: self.lengths.size]
+        return int(np.dot(hist, self.lengths[: hist.size]))
+
+    def to_dict(self) -> dict:
+        return {"id": self.codebook_id, "name": self.name, "lengths": self.lengths.tolist()}
+
+
+_CODEBOOKS: Dict[int, Codebook] = {}
+_BY_LENGTHS: Dict[bytes, Codebook] = {}
+
+
+def register_codebook(codebook: Codebook, replace: bool = False) -> Codebook:
+    """Registra un codebook por id (1-65535)."""
+    if codebook.codebook_id in _CODEBOOKS and not replace:
+        raise ValueError(f"Ya hay un codebook registrado con id {codebook.codebook_id}.")
+    old = _CODEBOOKS.get(codebook.codebook_id)
+    if old is not None:
+        _BY_LENGTHS.pop(old.lengths.tobytes(), None)
+    _CODEBOOKS[codebook.codebook_id] = codebook
+    _BY_LENGTHS[codebook.lengths.tobytes()] = codebook
+    return codebook
+
+
+def get_codebook(codebook_id: int) -> Codebook:
+    codebook = _CODEBOOKS.get(int(codebook_id))
+    if codebook is None:
+        raise ValueError(f"El archivo .huf usa el codebook {codebook_id}, que no está registrado.")
+    return codebook
+
+
+def available_codebooks() -> List[Codebook]:
+    return [_CODEBOOKS[k] for k in sorted(_CODEBOOKS)]
+
+
+def find_codebook(lengths: np.ndarray) -> Optional[Codebook]:
+    """El codebook registrado con exactamente estos largos (si hay)."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if not _BY_LENGTHS or lengths.size not in {c.lengths.size for c in _CODEBOOKS.values()}:
+        return None
+    return _BY_LENGTHS.get(lengths.tobytes())
+
+
+def best_codebook(hist: np.ndarray, max_bits: int, max_length: Optional[int] = MAX_CODE_LENGTH) -> Optional[Codebook]:
+    """
+    El codebook registrado que codifica `hist` en menos de `max_bits` bits (p. ej.
+    lo que cuesta la tabla propia con sus largos), o None si ninguno mejora.
+    """
+    best = None
+    for codebook in _CODEBOOKS.values():
+        if max_length is not None and codebook.max_length > max_length:
+            continue
+        cost = codebook.cost_bits(hist)
+        if cost is not None and cost < max_bits:
+            best, max_bits = codebook, cost
+    return best
+
+
+def train_codebook(
+    codebook_id: int,
+    name: str,
+    images: Iterable[np.ndarray],
+    predictor="med",
+    bits: int = 8,
+    max_length: int = MAX_CODE_LENGTH,
+) -> Codebook:
+    """
+    Entrena una tabla con los residuos de `predictor` de las imágenes (cada una
+    pesa lo mismo, sin importar el tamaño). Todos los símbolos 0..2**bits-1
+    reciben código: los que no aparecen en el corpus quedan con los más largos.
+    """
+    total = np.zeros(1 << bits, dtype=np.float64)
+    for img in images:
+        hist = histograma(residuals(img, predictor, 0, bits))[: 1 << bits]
+        if hist.sum():
+            total[: hist.size] += hist / hist.sum()
+    # Cuentas enteras; el +1 garantiza un código para cada símbolo
+    counts = np.round(total * (1 << 24)).astype(np.int64) + 1
+    return Codebook(codebook_id, name, code_lengths(counts, max_length))
+
+
+def load_codebooks(path: Union[str, Path] = CODEBOOKS_PATH) -> List[Codebook]:
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return [register_codebook(Codebook(c["id"], c["name"], c["lengths"])) for c in data["codebooks"]]
+
+
+def save_codebooks(codebooks: Iterable[Codebook], path: Union[str, Path] = CODEBOOKS_PATH) -> None:
+    data = {"codebooks": [c.to_dict() for c in codebooks]}
+    Path(path).write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+
+
+if CODEBOOKS_PATH.exists():
+    load_codebooks()
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import struct
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from compression import rans
+from compression.codebooks import best_codebook, find_codebook, get_codebook
+from compression.huffman_core import (
+    MAX_CODE_LENGTH,
+    BitWriter,
+    HuffmanTable,
+    canonical_codes,
+    code_lengths,
+    decode_segments,
+    histograma,
+    length_limit,
+)
+
+# Registro de codificadores de entropía del contenedor HUF2. El id del codec va
+# en el chunk b"CODC" (sin CODC = Huffman, como los archivos anteriores) y cada
+# codec guarda su modelo en sus propios chunks.
+
+
+class Codec:
+    """
+    Interfaz de un codificador de entropía por franjas (ver huffman_codec):
+      fit_histogram(hist) -> modelo (debe poder mandarse a otro proceso);
+        fit(symbols) lo arma con el histograma de los símbolos
+      model_chunks(modelo) / model_from_chunks(chunks): modelo <-> chunks del archivo
+      encode_stripes(rows, stripe_rows, modelo) -> [(bytes, bits)] por franja
+      decode_stripes(data, modelo, out, starts, ends, sizes): llena `out` (plano)
+    Cada franja debe arrancar en un byte nuevo y decodificarse sola.
+    """
+
+    codec_id: int
+    name: str
+
+    def fit(self, symbols: np.ndarray):
+        return self.fit_histogram(histograma(symbols))
+
+    def fit_histogram(self, hist: np.ndarray):
+        raise NotImplementedError
+
+    def model_chunks(self, model) -> List[Tuple[bytes, bytes]]:
+        raise NotImplementedError
+
+    def model_from_chunks(self, chunks):
+        raise NotImplementedError
+
+    def encode_stripes(self, rows: np.ndarray, stripe_rows: int, model) -> List[Tuple[bytes, int]]:
+        raise NotImplementedError
+
+    def decode_stripes(self, data, model, out: np.ndarray, starts, ends, sizes) -> None:
+        raise NotImplementedError
+
+
+_CODECS: Dict[int, Codec] = {}
+
+
+def register_codec(codec: Codec, replace: bool = False) -> Codec:
+    """Registra un codec por id y nombre (ids 0-255)."""
+    if not 0 <= codec.codec_id <= 255:
+        raise ValueError(f"Id de codec fuera de rango: {codec.codec_id}.")
+    for other in _CODECS.values():
+        if other.codec_id != codec.codec_id and other.name == codec.name:
+            raise ValueError(f"Ya hay un codec registrado con nombre {codec.name!r}.")
+    if codec.codec_id in _CODECS and not replace:
+        raise ValueError(f"Ya hay un codec registrado con id {codec.codec_id}.")
+    _CODECS[codec.codec_id] = codec
+    return codec
+
+
+def get_codec(codec: Union[str, int, Codec]) -> Codec:
+    """Busca un codec registrado por nombre o id."""
+    if isinstance(codec, Codec):
+        return codec
+    for c in _CODECS.values():
+        if codec == c.name or codec == c.codec_id:
+            return c
+    raise ValueError(f"Codec desconocido: {codec!r} (registrados: {', '.join(available_codecs())}).")
+
+
+def available_codecs() -> List[str]:
+    return [c.name for c in sorted(_CODECS.values(), key=lambda c: c.codec_id)]
+
+
+# Chunk b"CBID": id (uint16) del codebook registrado que reemplaza a los largos
+_CBID = struct.Struct("<H")
+
+
+def _stripe_sizes(rows: np.ndarray, stripe_rows: int) -> np.ndarray:
+    h, w = rows.shape
+    starts = np.arange(0, h, stripe_rows)
+    return np.minimum(stripe_rows, h - starts).astype(np.int64) * w
+
+
+class HuffmanCodec(Codec):
+    """
+    Huffman canónico (huffman_core). Modelo: (códigos, largos). Los largos van
+    en b"LENS" (uno por símbolo hasta el último usado) o, si ocupa menos (alfabetos
+    de 12/16 bits con pocos valores usados), en b"SLEN": símbolos usados (uint16)
+    seguidos de sus largos (uint8).
+    Con `codebooks`, si una tabla entrenada (compression.codebooks) codifica la
+    imagen en menos bits que la propia más sus largos, se usa esa y el archivo
+    guarda solo su id en b"CBID".
+    """
+
+    codec_id = 0
+    name = "huffman"
+
+    def __init__(self, max_code_length: int = MAX_CODE_LENGTH, codebooks: bool = True):
+        self.max_code_length = max_code_length
+        self.codebooks = codebooks
+
+    def fit_histogram(self, hist):
+        lengths = code_lengths(hist, length_limit(hist, self.max_code_length))
+        model = canonical_codes(lengths), lengths
+        if self.codebooks:
+            own_bits = int(np.dot(hist, lengths)) + 8 * sum(len(body) for _, body in self.model_chunks(model))
+            codebook = best_codebook(hist, own_bits - 8 * _CBID.size, self.max_code_length)
+            if codebook is not None:
+                return codebook.model
+        return model
+
+    def model_chunks(self, model):
+        _, lengths = model
+        codebook = find_codebook(lengths)
+        if codebook is not None:
+            return [(b"CBID", _CBID.pack(codebook.codebook_id))]
+        used = np.flatnonzero(lengths)
+        n_symbols = int(used[-1]) + 1 if used.size else 0
+        if n_symbols > 256 and 3 * used.size < n_symbols:
+            body = used.astype("<u2").tobytes() + lengths[used].astype(np.uint8).tobytes()
+            return [(b"SLEN", body)]
+        return [(b"LENS", lengths[:n_symbols].astype(np.uint8).tobytes())]
+
+    def model_from_chunks(self, chunks):
+        if b"CBID" in chunks:
+            if len(chunks[b"CBID"]) != _CBID.size:
+                raise ValueError("Archivo .huf corrupto (id de codebook inválido).")
+            return get_codebook(_CBID.unpack(chunks[b"CBID"])[0]).model
+        if b"SLEN" in chunks:
+            body = chunks[b"SLEN"]
+            n = len(body) // 3
+            syms = np.frombuffer(body, dtype="<u2", count=n).astype(np.int64)
+            if len(body) % 3 or (n and np.any(np.diff(syms) <= 0)):
+                raise ValueError("Archivo .huf corrupto (largos de código inválidos).")
+            lengths = np.zeros(int(syms[-1]) + 1 if n else 0, dtype=np.int64)
+            lengths[syms] = np.frombuffer(body, dtype=np.uint8, offset=2 * n)
+        elif b"LENS" in chunks:
+            lengths = np.frombuffer(chunks[b"LENS"], dtype=np.uint8).astype(np.int64)
+        else:
+            raise ValueError("Archivo .huf corrupto (faltan los largos de código).")
+        return canonical_codes(lengths), lengths
+
+    def encode_stripes(self, rows, stripe_rows, model):
+        codes, lengths = model
+        out = []
+        writer = BitWriter(codes, lengths)  # las tablas de pares se arman una vez
+        for r0 in range(0, rows.shape[0], stripe_rows):
+            writer.reset()
+            writer.write(rows[r0 : r0 + stripe_rows])
+            data, _ = writer.getvalue()
+            out.append((data, writer.bit_count))
+        return out
+
+    def decode_stripes(self, data, model, out, starts, ends, sizes):
+        codebook = find_codebook(model[1])
+        table = codebook.table(out.dtype) if codebook is not None else HuffmanTable(*model, dtype=out.dtype)
+        decode_segments(data, table, out, starts, ends, sizes)
+
+
+# Chunk b"RANS": bits de probabilidad y carriles, y frecuencia (uint16) de cada símbolo 0..n-1.
+# b"RANZ": igual pero disperso, símbolos usados (uint16) seguidos de sus frecuencias.
+_RANS = struct.Struct("<BH")
+
+
+class RansCodec(Codec):
+    """
+    rANS estático con streams intercalados (compression.rans): baja de 1 bit por
+    símbolo y queda más cerca de la entropía que Huffman, a cambio de algo más de CPU.
+    Modelo: (frecuencias, prob_bits, carriles).
+    """
+
+    codec_id = 1
+    name = "rans"
+
+    def __init__(self, prob_bits: int = rans.PROB_BITS, lanes: int = rans.LANES):
+        self.prob_bits = prob_bits
+        self.lanes = lanes
+
+    def fit_histogram(self, hist):
+        if np.count_nonzero(hist) > 1 << self.prob_bits:
+            raise ValueError(
+                f"rANS admite hasta {1 << self.prob_bits} valores distintos "
+                f"(hay {np.count_nonzero(hist)}): usar un predictor o el codec huffman."
+            )
+        return rans.normalize_freqs(hist, self.prob_bits), self.prob_bits, self.lanes
+
+    def model_chunks(self, model):
+        freqs, prob_bits, lanes = model
+        used = np.flatnonzero(freqs)
+        head = _RANS.pack(prob_bits, lanes)
+        if 2 * used.size < int(used[-1]) + 1:
+            return [(b"RANZ", head + used.astype("<u2").tobytes() + freqs[used].astype("<u2").tobytes())]
+        return [(b"RANS", head + freqs[: int(used[-1]) + 1].astype("<u2").tobytes())]
+
+    def model_from_chunks(self, chunks):
+        sparse = b"RANZ" in chunks
+        body = chunks.get(b"RANZ" if sparse else b"RANS")
+        if body is None or len(body) < _RANS.size or (len(body) - _RANS.size) % (4 if sparse else 2):
+            raise ValueError("Archivo .huf corrupto (falta el modelo rANS).")
+        prob_bits, lanes = _RANS.unpack_from(body, 0)
+        table = np.frombuffer(body, dtype="<u2", offset=_RANS.size).astype(np.int64)
+        if sparse:
+            syms, counts = table[: table.size // 2], table[table.size // 2 :]
+            if syms.size and np.any(np.diff(syms) <= 0):
+                raise ValueError("Archivo .huf corrupto (modelo rANS inválido).")
+            table = np.zeros(int(syms[-1]) + 1 if syms.size else 0, dtype=np.int64)
+            table[syms] = counts
+        freqs = table.astype(np.uint32)
+        if not 1 <= prob_bits <= 15 or lanes == 0 or int(freqs.sum()) != 1 << prob_bits:
+            raise ValueError("Archivo .huf corrupto (modelo rANS inválido).")
+        return freqs, prob_bits, lanes
+
+    def encode_stripes(self, rows, stripe_rows, model):
+        freqs, prob_bits, lanes = model
+        return rans.encode_streams(rows.ravel(), _stripe_sizes(rows, stripe_rows), freqs, prob_bits, lanes)
+
+    def decode_stripes(self, data, model, out, starts, ends, sizes):
+        freqs, prob_bits, lanes = model
+        rans.decode_streams(data, freqs, out, starts, ends, sizes, prob_bits, lanes)
+
+
+def _byte_spans(starts, ends):
+    return (np.asarray(starts, dtype=np.int64) // 8).tolist(), (np.asarray(ends, dtype=np.int64) // 8).tolist()
+
+
+class RawCodec(Codec):
+    """Sin codificación de entropía: los símbolos tal cual (1 o 2 bytes). Para imágenes que no comprimen."""
+
+    codec_id = 2
+    name = "raw"
+
+    def fit(self, symbols):
+        return None
+
+    def fit_histogram(self, hist):
+        return None
+
+    def model_chunks(self, model):
+        return []
+
+    def model_from_chunks(self, chunks):
+        return None
+
+    def encode_stripes(self, rows, stripe_rows, model):
+        dtype = rows.dtype.newbyteorder("<")
+        out = []
+        for r0 in range(0, rows.shape[0], stripe_rows):
+            data = rows[r0 : r0 + stripe_rows].astype(dtype).tobytes()
+            out.append((data, 8 * len(data)))
+        return out
+
+    def decode_stripes(self, data, model, out, starts, ends, sizes):
+        dtype = out.dtype.newbyteorder("<")
+        offset = 0
+        for b0, b1, size in zip(*_byte_spans(starts, ends), sizes):
+            if b1 - b0 != size * dtype.itemsize:
+                raise ValueError("Archivo .huf corrupto (franja de tamaño inválido).")
+            out[offset : offset + size] = np.frombuffer(data, dtype=dtype, count=size, offset=b0)
+            offset += size
+
+
+# Largo máximo de un run (se guarda largo - 1 en un byte)
+RLE_MAX_RUN = 256
+
+
+class RleCodec(Codec):
+    """
+    Run-length por franja (en orden raster): valores de cada run (1 o 2 bytes)
+    seguidos de los largos - 1 (1 byte; los runs más largos se parten). Para
+    imágenes casi todas de un mismo valor, p. ej. placas con mucho borde negro.
+    """
+
+    codec_id = 3
+    name = "rle"
+
+    fit = RawCodec.fit
+    fit_histogram = RawCodec.fit_histogram
+    model_chunks = RawCodec.model_chunks
+    model_from_chunks = RawCodec.model_from_chunks
+
+    def encode_stripes(self, rows, stripe_rows, model):
+        dtype = rows.dtype.newbyteorder("<")
+        out = []
+        for r0 in range(0, rows.shape[0], stripe_rows):
+            flat = rows[r0 : r0 + stripe_rows].ravel()
+            starts = np.flatnonzero(np.r_[True, flat[1:] != flat[:-1]])
+            lengths = np.diff(np.r_[starts, flat.size])
+            pieces = -(-lengths // RLE_MAX_RUN)
+            run_lengths = np.full(int(pieces.sum()), RLE_MAX_RUN, dtype=np.int64)
+            run_lengths[np.cumsum(pieces) - 1] = lengths - RLE_MAX_RUN * (pieces - 1)
+            data = np.repeat(flat[starts], pieces).astype(dtype).tobytes() + (run_lengths - 1).astype(np.uint8).tobytes()
+            out.append((data, 8 * len(data)))
+        return out
+
+    def decode_stripes(self, data, model, out, starts, ends, sizes):
+        dtype = out.dtype.newbyteorder("<")
+        offset = 0
+        for b0, b1, size in zip(*_byte_spans(starts, ends), sizes):
+            n_runs, rest = divmod(b1 - b0, dtype.itemsize + 1)
+            values = np.frombuffer(data, dtype=dtype, count=n_runs, offset=b0)
+            lengths = np.frombuffer(data, dtype=np.uint8, count=n_runs, offset=b0 + n_runs * dtype.itemsize)
+            lengths = lengths.astype(np.int64) + 1
+            if rest or int(lengths.sum()) != size:
+                raise ValueError("Archivo .huf corrupto (runs inválidos).")
+            out[offset : offset + size] = np.repeat(values, lengths)
+            offset += size
+
+
+HUFFMAN = register_codec(HuffmanCodec())
+RANS = register_codec(RansCodec())
+RAW = register_codec(RawCodec())
+RLE = register_codec(RleCodec())
@@ -1,15 +1,71 @@
 from __future__ import annotations
 
+import io
+import mmap
+import os
 import pickle
+import shutil
+import struct
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Tuple, Union
-from compression.huffman_core import HuffmanEncoding, HuffmanDec
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+from compression.codecs import HUFFMAN, Codec, HuffmanCodec, get_codec
+from compression.huffman_core import (
+    MAX_CODE_LENGTH,
+    as_symbols,
+    bit_depth,
+    canonical_codes,
+    code_tables,
+    codes_to_dict,
+    histograma,
+    pack_symbols,
+    unpack_symbols,
+)
+from compression.prediction import predictor_id, reconstruct, residuals
+from compression.selection import AUTO, RowSampler, choose_codec, choose_codec_rows
+from utils.lru import ByteLRUCache
 
 
 import numpy as np
 
-MAGIC = b"HUF1"
+MAGIC = b"HUF1"  # formato viejo: HuffmanPackage serializado con pickle (solo lectura)
+MAGIC_V2 = b"HUF2"
+
+# Formato HUF2 (little-endian):
+#   header: magic, bits por muestra, padding_bits, cantidad de chunks, alto, ancho, largo del payload
+#     bits por muestra: 8 (imagen uint8) o 9..16 (uint16, p. ej. 12 bits); los residuos
+#     de la predicción son mod 2**bits
+#   chunks: tag (4 bytes) + largo (uint32) + contenido
+#     b"CODC": id del codec de entropía (1 byte, ver compression.codecs); sin CODC es Huffman
+#     b"LENS": largo del código canónico de cada símbolo 0..n-1 (1 byte c/u)
+#     b"SLEN": los mismos largos en forma dispersa (ver compression.codecs.HuffmanCodec)
+#     b"CBID": en lugar de los largos, id de una tabla entrenada (ver compression.codebooks)
+#     b"RANS": modelo del codec rANS (ver compression.codecs.RansCodec)
+#     b"BIDX": filas por franja, cantidad de franjas y [bit inicial, bit final] de cada una (uint64)
+#     b"PRED": id del predictor (1 byte, ver compression.prediction); sin PRED se codifican los pixeles
+#     b"PREV": vista previa (lado mayor <= PREVIEW_SIZE) como un HUF2 completo con el mismo codec
+#   payload: bitstream del codec (Huffman: MSB primero); con BIDX, una franja tras otra
+#   (cada una arranca en un byte nuevo y se decodifica sola, también la predicción)
+_HEADER = struct.Struct("<4sBBHIIQ")
+_CHUNK = struct.Struct("<4sI")
+_BIDX = struct.Struct("<II")
+
+# Filas por franja al codificar (0 = un solo bitstream), procesos, predictor y
+# codec por defecto (el codec se puede elegir por instalación con HUF_CODEC;
+# "auto" elige por imagen, ver compression.selection)
+STRIPE_ROWS = 64
+DEFAULT_WORKERS = 1
+DEFAULT_PREDICTOR = "med"
+DEFAULT_CODEC = os.environ.get("HUF_CODEC", AUTO)
+# Filas por chunk al codificar por streaming un array 2D (p. ej. np.memmap)
+STREAM_ROWS = 1024
+# Lado mayor de la vista previa embebida (0 = sin vista previa)
+PREVIEW_SIZE = 256
+# Tope de la caché de imágenes decodificadas (MB, configurable con HUF_CACHE_MB)
+DECODED_CACHE_MB = int(os.environ.get("HUF_CACHE_MB", "256"))
 
 @dataclass
 class HuffmanPackage:
@@ -17,88 +73,758 @@ class HuffmanPackage:
     padding_bits: int
     codes: Dict[int, str]
     data: bytes
+    stripe_rows: int = 0
+    stripe_bits: Optional[np.ndarray] = None  # (n_franjas, 2): [bit inicial, bit final]
+    predictor: int = 0  # los códigos son de los residuos de este predictor (0 = pixeles)
+    bits: int = 8  # bits por muestra (> 8: imagen uint16)
+
+
+_POOLS: Dict[int, ProcessPoolExecutor] = {}
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    """Pool de procesos compartido (se crea una vez por cantidad de workers)."""
+    if workers not in _POOLS:
+        _POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _POOLS[workers]
+
+
+def _encode_stripes(codec_id: int, rows: np.ndarray, stripe_rows: int, model):
+    """Codifica cada franja de `rows` por separado. Devuelve [(bytes, bits)]."""
+    return get_codec(codec_id).encode_stripes(rows, stripe_rows, model)
+
+
+def _sample_dtype(bits: int):
+    return np.uint8 if bits <= 8 else np.uint16
+
+
+def _decode_stripes(
+    data, codec_id, model, width, starts, ends, sizes, predictor=0, stripe_rows=0, bits=8
+) -> np.ndarray:
+    """Decodifica un grupo de franjas consecutivas (todas en una pasada del codec)."""
+    out = np.empty(int(np.sum(sizes)), dtype=_sample_dtype(bits))
+    if out.size:
+        get_codec(codec_id).decode_stripes(data, model, out, starts, ends, sizes)
+    return reconstruct(out.reshape(-1, width), predictor, stripe_rows, bits)
+
+
+def _stripe_sizes(shape, stripe_rows: int, n_stripes: int) -> np.ndarray:
+    h, w = shape
+    rows = np.minimum(stripe_rows, h - stripe_rows * np.arange(n_stripes))
+    return rows.astype(np.int64) * w
+
+
+def _stripe_group(payload, stripe_bits, sizes, s0: int, s1: int):
+    """Bytes de las franjas [s0, s1) del payload y sus offsets relativos a esos bytes."""
+    starts, ends = stripe_bits[s0:s1, 0], stripe_bits[s0:s1, 1]
+    b0 = int(starts[0]) // 8
+    b1 = (int(ends[-1]) + 7) // 8
+    return payload[b0:b1], starts - 8 * b0, ends - 8 * b0, sizes[s0:s1]
+
 
+def _single_stripe(shape, payload, padding_bits):
+    """Payload sin índice (un solo bitstream) visto como una franja de todo el alto."""
+    return max(1, shape[0]), np.array([[0, len(payload) * 8 - padding_bits]], dtype=np.uint64)
 
-def _pack_bits(bitstring: str) -> Tuple[bytes, int]:
-    """Pack '0'/'1' string to bytes. Returns (data_bytes, padding_bits)."""
-    if not bitstring:
-        return b"", 0
-    padding = (8 - (len(bitstring) % 8)) % 8
-    bitstring_padded = bitstring + ("0" * padding)
-    as_int = int(bitstring_padded, 2)
-    data = as_int.to_bytes(len(bitstring_padded) // 8, byteorder="big")
-    return data, padding
 
+def _decode_payload(
+    payload, codec_id, model, shape, padding_bits, stripe_rows=0, stripe_bits=None, workers=1, predictor=0, bits=8
+):
+    out = np.empty(shape, dtype=_sample_dtype(bits))
+    if out.size == 0:
+        return out
+    if stripe_bits is None:
+        stripe_rows, stripe_bits = _single_stripe(shape, payload, padding_bits)
 
-def _unpack_bits(data: bytes, padding_bits: int) -> str:
-    """Unpack bytes to bitstring and remove padding bits."""
-    if not data:
-        return ""
-    bit_len = len(data) * 8
-    as_int = int.from_bytes(data, byteorder="big")
-    bitstring = bin(as_int)[2:].zfill(bit_len)
-    if padding_bits:
-        bitstring = bitstring[:-padding_bits]
-    return bitstring
+    n_stripes = len(stripe_bits)
+    sizes = _stripe_sizes(shape, stripe_rows, n_stripes)
+    if workers <= 1 or n_stripes == 1:
+        data, starts, ends, sizes = _stripe_group(payload, stripe_bits, sizes, 0, n_stripes)
+        rows = _decode_stripes(data, codec_id, model, shape[1], starts, ends, sizes, predictor, stripe_rows, bits)
+        return rows.reshape(shape)
 
+    # Cada worker recibe solo los bytes de su grupo de franjas
+    view = memoryview(payload)
+    futures = []
+    for g in np.array_split(np.arange(n_stripes), workers):
+        if g.size == 0:
+            continue
+        data, starts, ends, group_sizes = _stripe_group(view, stripe_bits, sizes, int(g[0]), int(g[-1]) + 1)
+        futures.append((int(g[0]), _pool(workers).submit(
+            _decode_stripes, bytes(data), codec_id, model, shape[1], starts, ends, group_sizes, predictor, stripe_rows,
+            bits,
+        )))
+    for s0, fut in futures:
+        rows = fut.result()
+        out[s0 * stripe_rows : s0 * stripe_rows + rows.shape[0]] = rows
+    return out
 
-def encode_image(img: np.ndarray) -> HuffmanPackage:
+
+def _encode_payload(symbols: np.ndarray, codec_id: int, model, stripe_rows: int, workers: int):
+    """Codifica `symbols` en franjas de `stripe_rows` filas. Devuelve (payload, índice de franjas)."""
+    n_stripes = -(-symbols.shape[0] // stripe_rows)
+    if workers <= 1 or n_stripes == 1:
+        encoded = _encode_stripes(codec_id, symbols, stripe_rows, model)
+    else:
+        futures = [
+            _pool(workers).submit(
+                _encode_stripes, codec_id, symbols[g[0] * stripe_rows : (g[-1] + 1) * stripe_rows], stripe_rows, model
+            )
+            for g in np.array_split(np.arange(n_stripes), workers)
+            if g.size
+        ]
+        encoded = [part for fut in futures for part in fut.result()]
+
+    stripe_bits = np.zeros((n_stripes, 2), dtype=np.uint64)
+    offset = 0
+    for i, (data, bits) in enumerate(encoded):
+        stripe_bits[i] = (8 * offset, 8 * offset + bits)
+        offset += len(data)
+    return b"".join(data for data, _ in encoded), stripe_bits
+
+
+def _check_image(img: np.ndarray, caller: str):
+    """(imagen uint8/uint16, bits por muestra); ver huffman_core.as_symbols."""
+    if img.ndim != 2:
+        raise ValueError(f"{caller} espera imagen 2D (grayscale).")
+    img = as_symbols(img)
+    return img, bit_depth(img)
+
+
+def encode_image(
+    img: np.ndarray,
+    max_code_length: Optional[int] = MAX_CODE_LENGTH,
+    stripe_rows: int = STRIPE_ROWS,
+    workers: int = DEFAULT_WORKERS,
+    predictor: Union[str, int, None] = DEFAULT_PREDICTOR,
+) -> HuffmanPackage:
     """
-    Encode uint8 2D image to HuffmanPackage.
-    Requiere tus funciones HuffmanEncoding/histograma/findCode (o equivalente).
+    Encode uint8 (or 12/16-bit uint16) 2D image to HuffmanPackage.
+    Los códigos son canónicos (se reconstruyen con los largos), de a lo sumo
+    `max_code_length` bits, y se empaquetan directo a bytes (ver huffman_core.BitWriter).
+    La imagen se parte en franjas de `stripe_rows` filas que comparten la tabla
+    pero se codifican (y decodifican) por separado, en `workers` procesos.
+    Con `predictor` ("left", "up", "avg", "med"; None/"none" = pixeles crudos) se
+    codifican los residuos de la predicción (ver compression.prediction).
+    Si una tabla entrenada (compression.codebooks) le gana a la propia, se usa esa.
     """
-    if img.ndim != 2:
-        raise ValueError("encode_image espera imagen 2D (grayscale).")
-    if img.dtype != np.uint8:
-        img = img.astype(np.uint8)
+    img, bits = _check_image(img, "encode_image")
+    shape = img.shape
+    predictor = predictor_id(predictor)
+    img = residuals(img, predictor, stripe_rows, bits)
 
-    comprimida_bits, dicc, ish, _ = HuffmanEncoding(img)
+    dicc = codes_to_dict(*HuffmanCodec(max_code_length).fit(img))
+    if stripe_rows <= 0 or img.size == 0:
+        data_bytes, padding_bits = pack_symbols(img, dicc)
+        return HuffmanPackage(
+            shape=shape, padding_bits=padding_bits, codes=dicc, data=data_bytes, predictor=predictor, bits=bits
+        )
 
-    data_bytes, padding_bits = _pack_bits(comprimida_bits)
-    return HuffmanPackage(shape=ish, padding_bits=padding_bits, codes=dicc, data=data_bytes)
+    data_bytes, stripe_bits = _encode_payload(img, HUFFMAN.codec_id, code_tables(dicc), stripe_rows, workers)
+    return HuffmanPackage(
+        shape=shape,
+        padding_bits=8 * len(data_bytes) - int(stripe_bits[-1, 1]),
+        codes=dicc,
+        data=data_bytes,
+        stripe_rows=stripe_rows,
+        stripe_bits=stripe_bits,
+        predictor=predictor,
+        bits=bits,
+    )
 
 
-def decode_image(pkg: HuffmanPackage) -> np.ndarray:
+def decode_image(pkg: HuffmanPackage, workers: int = DEFAULT_WORKERS) -> np.ndarray:
+    """
+    Decode HuffmanPackage back to uint8 (uint16 if bits > 8) 2D image.
+    Lee el payload empaquetado directo con la tabla de huffman_core.HuffmanTable;
+    si está en franjas, las reparte entre `workers` procesos.
     """
-    Decode HuffmanPackage back to uint8 2D image.
-    Requiere tu HuffmanDec(comprimida_bits, dicc, shape).
+    if pkg.stripe_bits is None:
+        symbols = unpack_symbols(pkg.data, pkg.padding_bits, pkg.codes, pkg.shape)
+        return reconstruct(symbols.astype(_sample_dtype(pkg.bits)), pkg.predictor, 0, pkg.bits)
+    return _decode_payload(
+        pkg.data, HUFFMAN.codec_id, code_tables(pkg.codes), tuple(pkg.shape), pkg.padding_bits,
+        pkg.stripe_rows, pkg.stripe_bits, workers, pkg.predictor, pkg.bits,
+    )
+
+
+def _layout_chunks(stripe_rows: int, stripe_bits: Optional[np.ndarray], predictor: int):
+    chunks = []
+    if stripe_bits is not None:
+        index = np.asarray(stripe_bits, dtype="<u8")
+        chunks.append((b"BIDX", _BIDX.pack(int(stripe_rows), len(index)) + index.tobytes()))
+    if predictor:
+        chunks.append((b"PRED", bytes([int(predictor)])))
+    return chunks
+
+
+def _container_header(shape, padding_bits: int, chunks, payload_len: int, bits: int = 8) -> bytes:
+    h, w = (int(x) for x in shape)
+    out = io.BytesIO()
+    out.write(_HEADER.pack(MAGIC_V2, int(bits), int(padding_bits), len(chunks), h, w, payload_len))
+    for tag, body in chunks:
+        out.write(_CHUNK.pack(tag, len(body)))
+        out.write(body)
+    return out.getvalue()
+
+
+def _container_bytes(shape, padding_bits: int, chunks, payload: bytes, bits: int = 8) -> bytes:
+    return _container_header(shape, padding_bits, chunks, len(payload), bits) + payload
+
+
+def package_to_bytes(pkg: HuffmanPackage) -> bytes:
     """
-    bits = _unpack_bits(pkg.data, pkg.padding_bits)
-    img = HuffmanDec(bits, pkg.codes, pkg.shape)
-    # Asegurar dtype/shape
-    img = np.array(img, dtype=np.uint8).reshape(pkg.shape)
-    return img
+    Serializa un HuffmanPackage en formato HUF2. Solo se guardan los largos de
+    código, así que un paquete con códigos no canónicos (p. ej. leído de un
+    HUF1) se vuelve a codificar.
+    """
+    codes, lengths = code_tables(pkg.codes)
+    if not np.array_equal(codes, canonical_codes(lengths)):
+        pkg = encode_image(decode_image(pkg), predictor=pkg.predictor)
+        codes, lengths = code_tables(pkg.codes)
+
+    chunks = HUFFMAN.model_chunks((codes, lengths)) + _layout_chunks(pkg.stripe_rows, pkg.stripe_bits, pkg.predictor)
+    return _container_bytes(pkg.shape, pkg.padding_bits, chunks, pkg.data, pkg.bits)
+
+
+class _PreviewAccumulator:
+    """
+    Vista previa por promedio de bloques de f x f pixeles (f entero, el menor
+    que deja el lado mayor <= size). Se puede alimentar de a bloques de filas.
+    """
+
+    def __init__(self, shape, size: int, dtype):
+        h, w = shape
+        self.f = f = max(1, -(-max(h, w) // size))
+        self.dtype = dtype
+        self._cols = np.arange(0, w, f)
+        rows_per = np.minimum(f, h - np.arange(0, h, f))
+        cols_per = np.minimum(f, w - self._cols)
+        self._counts = (rows_per[:, None] * cols_per[None, :]).astype(np.uint64)
+        self._sum = np.zeros(self._counts.shape, dtype=np.uint64)
+
+    def add(self, rows: np.ndarray, r0: int) -> None:
+        part = np.add.reduceat(rows, self._cols, axis=1, dtype=np.uint64)
+        block = (r0 + np.arange(rows.shape[0])) // self.f
+        first = np.flatnonzero(np.r_[True, block[1:] != block[:-1]])
+        self._sum[block[first]] += np.add.reduceat(part, first, axis=0)
+
+    def result(self) -> np.ndarray:
+        return ((self._sum + self._counts // 2) // self._counts).astype(self.dtype)
+
+
+def _preview_chunks(thumb: np.ndarray, codec: Codec, predictor: int):
+    return [(b"PREV", encode_to_bytes(thumb, codec=codec, predictor=predictor, preview=0))]
+
+
+def encode_to_bytes(
+    img: np.ndarray,
+    codec: Union[str, int, Codec] = DEFAULT_CODEC,
+    predictor: Union[str, int, None] = DEFAULT_PREDICTOR,
+    stripe_rows: int = STRIPE_ROWS,
+    workers: int = DEFAULT_WORKERS,
+    preview: int = PREVIEW_SIZE,
+) -> bytes:
+    """
+    Codifica una imagen a HUF2 con cualquier codec registrado (ver
+    compression.codecs). El id del codec queda en el archivo, así que
+    `decode_from_buffer` no necesita saber cuál se usó.
+    Con codec="auto" se elige el codec (y si conviene o no el predictor) con
+    una estimación rápida sobre una muestra (ver compression.selection).
+    Si la imagen es más grande que `preview` se embebe una vista previa de a
+    lo sumo `preview` pixeles de lado (ver HufReader.read_preview).
+    """
+    img, bits = _check_image(img, "encode_to_bytes")
+    predictor = predictor_id(predictor)
+    if stripe_rows <= 0:
+        stripe_rows = max(1, img.shape[0])
+    if codec == AUTO:
+        codec, predictor = choose_codec(img, predictor, bits, stripe_rows)
+    codec = get_codec(codec)
+    symbols = residuals(img, predictor, stripe_rows, bits)
+    model = codec.fit(symbols)
+
+    chunks = [] if codec.codec_id == HUFFMAN.codec_id else [(b"CODC", bytes([codec.codec_id]))]
+    chunks += codec.model_chunks(model)
+    if img.size == 0:
+        return _container_bytes(img.shape, 0, chunks + _layout_chunks(0, None, predictor), b"", bits)
+    data, stripe_bits = _encode_payload(symbols, codec.codec_id, model, stripe_rows, workers)
+    chunks += _layout_chunks(stripe_rows, stripe_bits, predictor)
+    if preview > 0 and max(img.shape) > preview:
+        acc = _PreviewAccumulator(img.shape, preview, img.dtype)
+        acc.add(img, 0)
+        chunks += _preview_chunks(acc.result(), codec, predictor)
+    return _container_bytes(img.shape, 8 * len(data) - int(stripe_bits[-1, 1]), chunks, data, bits)
+
+
+def _parse_huf2(buf):
+    """
+    Lee header y chunks de un HUF2 sobre cualquier objeto con buffer protocol
+    (bytes, memoryview, mmap). Devuelve (header, chunks, payload); chunks y
+    payload son memoryviews sobre `buf`, sin copias.
+    """
+    view = memoryview(buf).cast("B")
+    if len(view) < _HEADER.size:
+        raise ValueError("Archivo .huf inválido (header incompleto).")
+    magic, bits, padding, n_chunks, h, w, payload_len = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC_V2:
+        raise ValueError("Archivo .huf inválido (magic no coincide).")
+    if not 8 <= bits <= 16 or padding > 7:
+        raise ValueError("Archivo .huf corrupto o formato inesperado.")
+
+    off = _HEADER.size
+    chunks = {}
+    for _ in range(n_chunks):
+        if off + _CHUNK.size > len(view):
+            raise ValueError("Archivo .huf corrupto (chunk incompleto).")
+        tag, size = _CHUNK.unpack_from(view, off)
+        off += _CHUNK.size
+        if off + size > len(view):
+            raise ValueError("Archivo .huf corrupto (chunk incompleto).")
+        chunks[tag] = view[off : off + size]
+        off += size
+    if off + payload_len > len(view):
+        raise ValueError("Archivo .huf corrupto (payload incompleto).")
+
+    header = {"bits": bits, "padding_bits": padding, "shape": (h, w)}
+    return header, chunks, view[off : off + payload_len]
+
+
+def _stripes_from_chunks(chunks, shape):
+    """(filas por franja, índice de franjas) o (0, None) si el payload es uno solo."""
+    if b"BIDX" not in chunks:
+        return 0, None
+    body = chunks[b"BIDX"]
+    stripe_rows, n = _BIDX.unpack_from(body, 0)
+    index = np.frombuffer(body, dtype="<u8", count=2 * n, offset=_BIDX.size).reshape(n, 2)
+    if stripe_rows == 0 or n != -(-shape[0] // stripe_rows):
+        raise ValueError("Archivo .huf corrupto (índice de franjas inválido).")
+    return stripe_rows, index
+
+
+def _codec_from_chunks(chunks) -> Codec:
+    if b"CODC" not in chunks:
+        return HUFFMAN
+    body = chunks[b"CODC"]
+    if len(body) != 1:
+        raise ValueError("Archivo .huf corrupto (codec inválido).")
+    try:
+        return get_codec(body[0])
+    except ValueError as e:
+        raise ValueError(f"Archivo .huf con codec no soportado (id {body[0]}).") from e
+
+
+def _predictor_from_chunks(chunks) -> int:
+    if b"PRED" not in chunks:
+        return 0
+    body = chunks[b"PRED"]
+    if len(body) != 1:
+        raise ValueError("Archivo .huf corrupto (predictor inválido).")
+    try:
+        return predictor_id(body[0])
+    except ValueError as e:
+        raise ValueError("Archivo .huf corrupto (predictor inválido).") from e
+
+
+def decode_from_buffer(buf, workers: int = DEFAULT_WORKERS) -> np.ndarray:
+    """Decodifica una imagen HUF2 directo desde bytes/memoryview/mmap (cualquier codec registrado)."""
+    header, chunks, payload = _parse_huf2(buf)
+    codec = _codec_from_chunks(chunks)
+    stripe_rows, stripe_bits = _stripes_from_chunks(chunks, header["shape"])
+    return _decode_payload(
+        payload, codec.codec_id, codec.model_from_chunks(chunks), header["shape"], header["padding_bits"],
+        stripe_rows, stripe_bits, workers, _predictor_from_chunks(chunks), header["bits"],
+    )
+
+
+def package_from_buffer(buf) -> HuffmanPackage:
+    header, chunks, payload = _parse_huf2(buf)
+    if _codec_from_chunks(chunks) is not HUFFMAN:
+        raise ValueError("El archivo .huf no usa Huffman (usar decode_from_buffer).")
+    codes, lengths = HUFFMAN.model_from_chunks(chunks)
+    stripe_rows, stripe_bits = _stripes_from_chunks(chunks, header["shape"])
+    return HuffmanPackage(
+        shape=header["shape"],
+        padding_bits=header["padding_bits"],
+        codes=codes_to_dict(codes, lengths),
+        data=bytes(payload),
+        stripe_rows=stripe_rows,
+        stripe_bits=None if stripe_bits is None else stripe_bits.astype(np.uint64),
+        predictor=_predictor_from_chunks(chunks),
+        bits=header["bits"],
+    )
+
+
+class HufReader:
+    """
+    Lectura parcial de un .huf (HUF2): mapea el archivo en memoria y al abrirlo
+    solo parsea el header y el índice de franjas. `read_rows`/`read_region`
+    decodifican únicamente las franjas que tocan el pedido.
+
+    Un HUF2 sin índice se trata como una sola franja (se decodifica entero).
+    `read_preview` lee la vista previa embebida sin tocar el payload.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(4) == MAGIC:
+                raise ValueError("HufReader no soporta archivos HUF1 (usar load_huf).")
+            f.seek(0)
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # archivo vacío
+                raise ValueError("Archivo .huf inválido (header incompleto).") from e
+
+        self._payload = self._preview = None
+        try:
+            self._parse()
+        except Exception as e:
+            # Archivo corrupto: las vistas sobre el mmap que quedaron en los frames del
+            # error se sueltan antes de cerrarlo (si no, queda mapeado hasta el GC)
+            traceback.clear_frames(e.__traceback__)
+            self._stripe_bits = None
+            self._release_views()
+            self._mm.close()
+            raise
+
+    def _parse(self) -> None:
+        header, chunks, self._payload = _parse_huf2(self._mm)
+        try:
+            self.shape: Tuple[int, int] = header["shape"]
+            self.bits: int = header["bits"]
+            self.codec = _codec_from_chunks(chunks)
+            self._model = self.codec.model_from_chunks(chunks)
+            self.stripe_rows, self._stripe_bits = _stripes_from_chunks(chunks, self.shape)
+            if self._stripe_bits is not None:
+                self._stripe_bits = self._stripe_bits.copy()
+            self.predictor = _predictor_from_chunks(chunks)
+            self._preview = chunks.pop(b"PREV", None)
+        finally:
+            # Solo payload y vista previa quedan apuntando al mmap (si no, close() no puede liberarlo)
+            for chunk in chunks.values():
+                chunk.release()
+        if self._stripe_bits is None:
+            self.stripe_rows, self._stripe_bits = _single_stripe(self.shape, self._payload, header["padding_bits"])
+        self._sizes = _stripe_sizes(self.shape, self.stripe_rows, len(self._stripe_bits))
+
+    def read_rows(self, start: int, stop: int) -> np.ndarray:
+        """Filas [start, stop) de la imagen."""
+        h, w = self.shape
+        start, stop, _ = slice(start, stop).indices(h)
+        if stop <= start or w == 0:
+            return np.empty((max(0, stop - start), w), dtype=_sample_dtype(self.bits))
+        s0 = start // self.stripe_rows
+        s1 = -(-stop // self.stripe_rows)
+        data, starts, ends, sizes = _stripe_group(self._payload, self._stripe_bits, self._sizes, s0, s1)
+        rows = _decode_stripes(
+            data, self.codec.codec_id, self._model, w, starts, ends, sizes, self.predictor, self.stripe_rows, self.bits
+        )
+        r0 = s0 * self.stripe_rows
+        return rows[start - r0 : stop - r0]
+
+    def read_region(self, y0: int, y1: int, x0: int, x1: int) -> np.ndarray:
+        """Recorte [y0:y1, x0:x1] (solo se decodifican las franjas de esas filas)."""
+        return np.ascontiguousarray(self.read_rows(y0, y1)[:, x0:x1])
+
+    def read(self) -> np.ndarray:
+        return self.read_rows(0, self.shape[0])
+
+    @property
+    def has_preview(self) -> bool:
+        return self._preview is not None
+
+    def read_preview(self) -> Optional[np.ndarray]:
+        """Vista previa embebida, o None si el archivo no tiene (imágenes chicas o archivos viejos)."""
+        if self._preview is None:
+            return None
+        return decode_from_buffer(self._preview)
+
+    def _release_views(self) -> None:
+        if self._preview is not None:
+            self._preview.release()
+        if self._payload is not None:
+            self._payload.release()
+
+    def close(self) -> None:
+        self._release_views()
+        self._mm.close()
+
+    def __enter__(self) -> "HufReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class _HUF1Unpickler(pickle.Unpickler):
+    """Los HUF1 son pickles: solo se permite reconstruir HuffmanPackage."""
+
+    def find_class(self, module, name):
+        if name == "HuffmanPackage" and module in (__name__, "compression.huffman_codec"):
+            return HuffmanPackage
+        raise ValueError(f"Archivo .huf inválido (objeto no permitido: {module}.{name}).")
+
+
+def _load_huf1(payload: bytes) -> HuffmanPackage:
+    try:
+        pkg = _HUF1Unpickler(io.BytesIO(payload)).load()
+    except (pickle.UnpicklingError, EOFError) as e:
+        raise ValueError("Archivo .huf corrupto o formato inesperado.") from e
+    if not isinstance(pkg, HuffmanPackage):
+        raise ValueError("Archivo .huf corrupto o formato inesperado.")
+    return pkg
 
 
 def save_huf(pkg: HuffmanPackage, path: Union[str, Path]) -> None:
     path = Path(path)
-    payload = pickle.dumps(pkg, protocol=pickle.HIGHEST_PROTOCOL)
     with open(path, "wb") as f:
-        f.write(MAGIC)
-        f.write(payload)
+        f.write(package_to_bytes(pkg))
 
 
 def load_huf(path: Union[str, Path]) -> HuffmanPackage:
     path = Path(path)
-    with open(path, "rb") as f:
-        magic = f.read(4)
-        if magic != MAGIC:
-            raise ValueError("Archivo .huf inválido (magic no coincide).")
-        payload = f.read()
-    pkg = pickle.loads(payload)
-    if not isinstance(pkg, HuffmanPackage):
-        raise ValueError("Archivo .huf corrupto o formato inesperado.")
-    return pkg
+    raw = path.read_bytes()
+    if raw[:4] == MAGIC:
+        return _load_huf1(raw[4:])
+    return package_from_buffer(raw)
+
+
+def compress_image_to_huf_file(
+    img: np.ndarray,
+    out_path: Union[str, Path],
+    workers: int = DEFAULT_WORKERS,
+    predictor: Union[str, int, None] = DEFAULT_PREDICTOR,
+    codec: Union[str, int, Codec] = DEFAULT_CODEC,
+    preview: int = PREVIEW_SIZE,
+) -> Path:
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_bytes(encode_to_bytes(img, codec=codec, predictor=predictor, workers=workers, preview=preview))
+    return out_path
 
 
-def compress_image_to_huf_file(img: np.ndarray, out_path: Union[str, Path]) -> Path:
+RowChunks = Union[Callable[[], Iterable[np.ndarray]], Iterable[np.ndarray], np.ndarray]
+
+
+def _row_chunk_source(chunks: RowChunks) -> Callable[[], Iterable[np.ndarray]]:
+    """Función que devuelve un recorrido nuevo de los chunks (hacen falta dos pasadas)."""
+    if callable(chunks):
+        return chunks
+    if isinstance(chunks, np.ndarray):
+        if chunks.ndim != 2:
+            raise ValueError("compress_row_chunks_to_huf_file espera imagen 2D (grayscale).")
+        return lambda: (chunks[r : r + STREAM_ROWS] for r in range(0, chunks.shape[0], STREAM_ROWS))
+    if iter(chunks) is chunks:
+        raise ValueError(
+            "Un iterador solo se puede recorrer una vez: pasar una función que lo cree o una lista de chunks."
+        )
+    return lambda: chunks
+
+
+def _stripe_groups(chunks: Iterable[np.ndarray], stripe_rows: int) -> Iterator[np.ndarray]:
+    """
+    Reagrupa chunks de filas en bloques de franjas completas (el último puede
+    quedar corto); cada bloque tiene a lo sumo un chunk más una franja de filas.
+    """
+    pending = []
+    n_pending = 0
+    width = dtype = None
+    for chunk in chunks:
+        chunk = as_symbols(chunk)
+        if chunk.ndim == 1:
+            chunk = chunk[None, :]
+        if chunk.ndim != 2:
+            raise ValueError("Cada chunk debe ser un bloque 2D de filas.")
+        if width is None:
+            width, dtype = chunk.shape[1], chunk.dtype
+        elif chunk.shape[1] != width:
+            raise ValueError(f"Los chunks tienen anchos distintos ({width} y {chunk.shape[1]}).")
+        if chunk.dtype != dtype:
+            # La profundidad la fija el primer chunk
+            if dtype != np.uint16:
+                raise ValueError("Los chunks mezclan imágenes de 8 y de 16 bits.")
+            chunk = chunk.astype(np.uint16)
+        pending.append(chunk)
+        n_pending += chunk.shape[0]
+        if n_pending >= stripe_rows:
+            rows = np.concatenate(pending) if len(pending) > 1 else pending[0]
+            cut = n_pending - n_pending % stripe_rows
+            yield rows[:cut]
+            pending = [rows[cut:]] if cut < n_pending else []
+            n_pending -= cut
+    if n_pending:
+        yield np.concatenate(pending)
+
+
+def _add_counts(hist: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Suma dos histogramas de largo distinto (uint16: el alfabeto crece con el máximo)."""
+    if counts.size > hist.size:
+        counts[: hist.size] += hist
+        return counts
+    hist[: counts.size] += counts
+    return hist
+
+
+def compress_row_chunks_to_huf_file(
+    chunks: RowChunks,
+    out_path: Union[str, Path],
+    predictor: Union[str, int, None] = DEFAULT_PREDICTOR,
+    codec: Union[str, int, Codec] = DEFAULT_CODEC,
+    stripe_rows: int = STRIPE_ROWS,
+    preview: int = PREVIEW_SIZE,
+) -> Path:
+    """
+    Versión por streaming de compress_image_to_huf_file para imágenes que no
+    conviene tener enteras en memoria. `chunks` son bloques de filas del mismo
+    ancho y se recorren dos veces: una para el histograma y otra para codificar
+    y escribir el archivo franja por franja. La memoria queda acotada por el
+    tamaño de chunk. `chunks` puede ser una función que devuelve un iterador
+    nuevo, algo iterable dos veces (p. ej. una lista) o un array 2D (np.memmap).
+    Chunks uint16 (12/16 bits) se guardan con la profundidad que usa el máximo.
+    Con codec="auto" el codec se elige en la primera pasada con la misma muestra
+    repartida a lo alto que usa encode_to_bytes (ver selection.RowSampler).
+    """
+    if stripe_rows <= 0:
+        raise ValueError("La codificación por streaming necesita franjas (stripe_rows > 0).")
+    predictor = predictor_id(predictor)
+    source = _row_chunk_source(chunks)
+    # Con "auto" la 1ra pasada también junta la muestra y el histograma sin predictor,
+    # así la elección no necesita otra lectura de los chunks
+    sampler = RowSampler(stripe_rows) if codec == AUTO else None
+    if sampler is None:
+        codec = get_codec(codec)
+
+    # 1ra pasada: histograma de los residuos, tamaño y profundidad de la imagen.
+    # Con uint16 los residuos se cuentan mod 2**16 y después se pliegan a
+    # mod 2**bits (2**bits divide a 2**16), que recién se conoce al final.
+    hist = np.zeros(0, dtype=np.int64)
+    raw_hist = np.zeros(0, dtype=np.int64)
+    h, w, bits = 0, 0, 8
+    for rows in _stripe_groups(source(), stripe_rows):
+        wide = rows.dtype == np.uint16
+        if wide:
+            bits = max(bits, bit_depth(rows))
+        hist = _add_counts(hist, histograma(residuals(rows, predictor, stripe_rows, 16 if wide else 8)))
+        if sampler is not None:
+            sampler.add(rows)
+            if predictor:
+                raw_hist = _add_counts(raw_hist, histograma(rows))
+        h, w = h + rows.shape[0], rows.shape[1]
+    if sampler is not None:
+        codec, chosen = choose_codec_rows(sampler, predictor)
+        if chosen != predictor:
+            hist, predictor = raw_hist, chosen
+        codec = get_codec(codec)
+    if hist.size > 1 << bits:
+        hist = np.pad(hist, (0, -hist.size % (1 << bits))).reshape(-1, 1 << bits).sum(axis=0)
+    model = codec.fit_histogram(hist)
+
+    n_stripes = -(-h // stripe_rows)
+    stripe_bits = np.zeros((n_stripes, 2), dtype=np.uint64) if h and w else None
+    head = [] if codec.codec_id == HUFFMAN.codec_id else [(b"CODC", bytes([codec.codec_id]))]
+    head += codec.model_chunks(model)
+
+    # 2da pasada: el payload va a un temporal a medida que sale (junto con la
+    # vista previa) y al final se arma el archivo: header, chunks y payload
     out_path = Path(out_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    pkg = encode_image(img)
-    save_huf(pkg, out_path)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    acc = None
+    if preview > 0 and max(h, w) > preview:
+        acc = _PreviewAccumulator((h, w), preview, np.uint16 if bits > 8 else np.uint8)
+    try:
+        with tempfile.TemporaryFile(dir=out_path.parent) as payload:
+            offset = 0
+            done = 0
+            rows_seen = 0
+            for rows in _stripe_groups(source(), stripe_rows) if stripe_bits is not None else ():
+                if rows_seen + rows.shape[0] > h or rows.shape[1] != w or int(rows.max(initial=0)) >> bits:
+                    break
+                if acc is not None:
+                    acc.add(rows, rows_seen)
+                rows_seen += rows.shape[0]
+                symbols = residuals(rows, predictor, stripe_rows, bits)
+                for data, n_bits in codec.encode_stripes(symbols, stripe_rows, model):
+                    stripe_bits[done] = (8 * offset, 8 * offset + n_bits)
+                    payload.write(data)
+                    offset += len(data)
+                    done += 1
+            if stripe_bits is not None and (rows_seen != h or done != n_stripes):
+                raise ValueError("Los chunks cambiaron entre la primera y la segunda pasada.")
+
+            padding_bits = 8 * offset - int(stripe_bits[-1, 1]) if stripe_bits is not None else 0
+            chunks_final = head + _layout_chunks(stripe_rows, stripe_bits, predictor)
+            if acc is not None:
+                chunks_final += _preview_chunks(acc.result(), codec, predictor)
+            with open(tmp_path, "wb") as f:
+                f.write(_container_header((h, w), padding_bits, chunks_final, offset, bits))
+                payload.seek(0)
+                shutil.copyfileobj(payload, f)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
     return out_path
 
 
-def decompress_huf_file_to_image(huf_path: Union[str, Path]) -> np.ndarray:
-    pkg = load_huf(huf_path)
-    return decode_image(pkg)
+def decompress_huf_preview(huf_path: Union[str, Path]) -> np.ndarray:
+    """
+    Vista previa embebida del .huf (sin decodificar la imagen completa); si el
+    archivo no tiene, devuelve la imagen completa.
+    """
+    with open(huf_path, "rb") as f:
+        legacy = f.read(4) == MAGIC
+    if legacy:
+        return decompress_huf_file_to_image(huf_path)
+    with HufReader(huf_path) as reader:
+        img = reader.read_preview()
+    return img if img is not None else decompress_huf_file_to_image(huf_path)
+
+
+def decompress_huf_file_to_image(huf_path: Union[str, Path], workers: int = DEFAULT_WORKERS) -> np.ndarray:
+    with open(huf_path, "rb") as f:
+        legacy = f.read(4) == MAGIC
+    if legacy:
+        return decode_image(load_huf(huf_path), workers=workers)
+    with HufReader(huf_path) as reader:
+        return _decode_payload(
+            reader._payload, reader.codec.codec_id, reader._model, reader.shape, 0,
+            reader.stripe_rows, reader._stripe_bits, workers, reader.predictor, reader.bits,
+        )
+
+
+class DecodedImageCache(ByteLRUCache[np.ndarray]):
+    """
+    Caché LRU de imágenes decodificadas, compartida por todo el proceso (todas
+    las sesiones de Streamlit). La clave es (path resuelto, tamaño, mtime), así
+    un archivo reescrito no devuelve la imagen vieja. Se desalojan las menos
+    usadas cuando el total pasa de `max_bytes`. Los arrays se devuelven de solo
+    lectura porque se comparten entre sesiones.
+    """
+
+    def get(self, path: Union[str, Path], loader: Callable[[Path], np.ndarray], kind: str = "full") -> np.ndarray:
+        """Imagen de `path` desde la caché, o `loader(path)` si no está (o cambió el archivo)."""
+        path = Path(path).resolve()
+        st = path.stat()
+        key = (str(path), st.st_size, st.st_mtime_ns, kind)
+
+        def load() -> np.ndarray:
+            img = loader(path)
+            img.setflags(write=False)
+            return img
+
+        return self.get_or_load(key, load)
+
+
+DECODED_CACHE = DecodedImageCache(DECODED_CACHE_MB << 20)
+
+
+def load_huf_image_cached(huf_path: Union[str, Path], preview: bool = False) -> np.ndarray:
+    """
+    Como decompress_huf_file_to_image (o decompress_huf_preview con
+    preview=True) pero pasando por DECODED_CACHE. El array es de solo lectura.
+    """
+    if preview:
+        return DECODED_CACHE.get(huf_path, decompress_huf_preview, kind="preview")
+    return DECODED_CACHE.get(huf_path, decompress_huf_file_to_image)
@@ -1,83 +1,164 @@
+import heapq
+import sys
+
 import numpy as np
 
+def as_symbols(img: np.ndarray) -> np.ndarray:
+    """
+    Pasa la imagen a símbolos uint8 o uint16 (12/16 bits). Los enteros usan el
+    menor de los dos que alcance; float/bool se convierten a uint8 como siempre.
+    """
+    img = np.asarray(img)
+    if img.dtype in (np.uint8, np.uint16):
+        return img
+    if not np.issubdtype(img.dtype, np.integer):
+        return img.astype(np.uint8)
+    if img.size and (int(img.min()) < 0 or int(img.max()) > 0xFFFF):
+        raise ValueError("La imagen tiene valores fuera de rango (se esperan enteros de 0 a 65535).")
+    return img.astype(np.uint8 if int(img.max(initial=0)) <= 0xFF else np.uint16)
+
+
+def bit_depth(symbols: np.ndarray) -> int:
+    """Bits por muestra: 8 para uint8; para uint16, los que usa el valor máximo (entre 9 y 16)."""
+    if symbols.dtype == np.uint8:
+        return 8
+    return max(9, int(symbols.max(initial=0)).bit_length())
+
+
 def histograma(img: np.ndarray) -> np.ndarray:
     """
-    Histograma para imagen uint8 (256 bins).
+    Histograma de la imagen: 256 bins para uint8 y, para uint16, uno por valor
+    hasta el máximo usado (el alfabeto real, no los 65536 posibles).
     Devuelve counts (no normalizado).
     """
-    if img.dtype != np.uint8:
-        img = img.astype(np.uint8)
-    return np.bincount(img.ravel(), minlength=256).astype(np.int64)
+    img = as_symbols(img)
+    v = np.ascontiguousarray(img).ravel()
+    if v.dtype != np.uint8:
+        return np.bincount(v, minlength=1).astype(np.int64)
+    # Cuento de a pares de píxeles (vista '<u2'): la mitad de elementos para bincount
+    n_pares = v.size // 2
+    pares = np.bincount(v[: 2 * n_pares].view("<u2"), minlength=65536).reshape(256, 256)
+    hist = pares.sum(axis=0) + pares.sum(axis=1)
+    if v.size % 2:
+        hist[v[-1]] += 1
+    return hist.astype(np.int64)
 
 
-def findCode(tree, val):
-    code, padre = tree[val]
-    if padre != 'r':
-        code = findCode(tree, padre) + code
-    return code
+# Largo máximo de código por defecto al codificar: acota la tabla de decodificación
+MAX_CODE_LENGTH = 15
 
 
-def HuffmanEncoding(img):
-    # Paso 1: Tamaño de la imagen y rango de niveles de grises
-    if img.ndim != 2:
-        raise ValueError("HuffmanEncoding espera una imagen 2D (grayscale).")
-    if img.dtype != np.uint8:
-        img = img.astype(np.uint8)
+def _tree_lengths(counts: np.ndarray) -> np.ndarray:
+    """
+    Largos de Huffman (sin límite) con un heap: O(n log n) en la cantidad de
+    símbolos. Cada merge guarda el padre; la profundidad sale recorriendo los
+    nodos desde la raíz.
+    """
+    n = len(counts)
+    heap = [(int(c), i) for i, c in enumerate(counts)]
+    heapq.heapify(heap)
+    parent = np.zeros(2 * n - 1, dtype=np.int64)
+    nodo = n
+    while len(heap) > 1:
+        c1, a1 = heapq.heappop(heap)
+        c2, a2 = heapq.heappop(heap)
+        parent[a1] = parent[a2] = nodo
+        heapq.heappush(heap, (c1 + c2, nodo))
+        nodo += 1
+
+    depth = np.zeros(2 * n - 1, dtype=np.int64)
+    for i in range(2 * n - 3, -1, -1):  # la raíz es el último nodo
+        depth[i] = depth[parent[i]] + 1
+    return depth[:n]
+
 
-    fil, col = img.shape
-    pixeles = fil * col
+def _package_merge(counts: np.ndarray, max_length: int) -> np.ndarray:
+    """
+    Largos óptimos con tope `max_length` (algoritmo package-merge).
 
-    # Paso 2: Calculo el histograma normalizado
-    hist = histograma(img) / pixeles
+    En cada nivel se ordenan hojas + paquetes del nivel anterior y se agrupan
+    de a dos; del último nivel se toman los 2n-2 ítems más livianos. El largo
+    de cada símbolo es la cantidad de ítems elegidos que lo contienen.
+    """
+    n = len(counts)
+    leaf_w = np.asarray(counts, dtype=np.int64)
 
-    # Paso 3: Genero dos listas vacias para las frecuencias y para la intensidad correspondiente
-    lista_histograma = []
-    lista_intensidad = []
+    levels = []  # por nivel: (es_hoja, índice de hoja o de paquete)
+    pkg_w = np.zeros(0, dtype=np.int64)
+    for _ in range(max_length):
+        w = np.concatenate([leaf_w, pkg_w])
+        order = np.argsort(w, kind="stable")
+        is_leaf = order < n
+        ref = np.where(is_leaf, order, order - n)
+        levels.append((is_leaf, ref))
+        w = w[order]
+        m = len(w) // 2 * 2
+        pkg_w = w[0:m:2] + w[1:m:2]
 
-    # Paso 4: Ingreso valores en las listas
-    for i in range(len(hist)):
-        if hist[i] != 0:
-            lista_histograma.append([hist[i], i])
-            lista_intensidad.append(i)
+    lengths = np.zeros(n, dtype=np.int64)
+    selected = np.arange(2 * n - 2)
+    for is_leaf, ref in reversed(levels):
+        np.add.at(lengths, ref[selected[is_leaf[selected]]], 1)
+        pkgs = ref[selected[~is_leaf[selected]]]
+        selected = np.concatenate([2 * pkgs, 2 * pkgs + 1])
+    return lengths
 
-    # Paso 5: Creo mi árbol y el contador para los nodos
-    tree = {}
-    k = 0  # para ir poniendo nombre a los nodos
 
-    # Paso 6: Hasta que quede sólo un elemento en lista_histograma
-    while len(lista_histograma) > 1:
-        # 6.1) Ordeno histograma según la frecuencia (hist(i)) de menor a mayor
-        lista_histograma.sort(key=lambda x: x[0])
+def code_lengths(hist: np.ndarray, max_length=None) -> np.ndarray:
+    """
+    Largo del código de Huffman de cada símbolo del histograma (0 = no aparece).
+    Con `max_length` los largos quedan acotados (óptimos bajo esa restricción).
+    """
+    hist = np.asarray(hist)
+    used = np.flatnonzero(hist)
+    lengths = np.zeros(len(hist), dtype=np.int64)
+    if used.size == 0:
+        return lengths
+    if used.size == 1:
+        # Imagen de un solo valor: igual hace falta un bit por píxel
+        lengths[used] = 1
+        return lengths
 
-        # 6.2) Selecciono los primeros dos elementos más chicos
-        a1 = lista_histograma.pop(0)
-        a2 = lista_histograma.pop(0)
+    sub = _tree_lengths(hist[used])
+    if max_length is not None and int(sub.max()) > max_length:
+        if (1 << max_length) < used.size:
+            raise ValueError(f"No entran {used.size} símbolos en códigos de {max_length} bits.")
+        sub = _package_merge(hist[used], max_length)
+    lengths[used] = sub
+    return lengths
 
-        # 6.3) Saco la frecuencia conjunta
-        fconj = a1[0] + a2[0]
 
-        # 6.4) Le asigno un nombre (nombre del nodo)
-        k += 1
-        kstr = str(k)
-        nstr = 'n' + kstr
+def length_limit(hist: np.ndarray, max_length=None):
+    """
+    `max_length`, o el menor largo en el que entran todos los símbolos usados
+    (alfabetos de 16 bits con más de 2**max_length valores distintos).
+    """
+    if max_length is None:
+        return None
+    n_used = int(np.count_nonzero(hist))
+    return max(int(max_length), (n_used - 1).bit_length())
+
 
-        # 6.5) Los vuelvo a agregar a la lista para que se reordenen en el while
-        lista_histograma.append([fconj, nstr])
+def HuffmanCodes(img, max_length=None):
+    """
+    Construye el diccionario de Huffman {intensidad: '0101...'} de una imagen 2D.
+    Los códigos son canónicos: quedan determinados por los largos.
+    """
+    if img.ndim != 2:
+        raise ValueError("HuffmanCodes espera una imagen 2D (grayscale).")
+    img = as_symbols(img)
 
-        # 6.6) Armo el arbol
-        tree[a1[1]] = ['0', nstr]
-        tree[a2[1]] = ['1', nstr]
+    hist = histograma(img)
+    lengths = code_lengths(hist, length_limit(hist, max_length))
+    return codes_to_dict(canonical_codes(lengths), lengths)
 
-    # Paso 7: Finalizo el árbol
-    tree[nstr] = ['', 'r']
 
-    # Paso 8: Inicio el diccionario con la codificación
-    dicc = {}
+def HuffmanEncoding(img):
+    if img.ndim != 2:
+        raise ValueError("HuffmanEncoding espera una imagen 2D (grayscale).")
+    img = as_symbols(img)
 
-    # Paso 9: Codifico el árbol
-    for a in lista_intensidad:
-        code = findCode(tree, a)
-        dicc[a] = code
+    dicc = HuffmanCodes(img)
 
     # Paso 10: Recorro la imagen y genero una lista de string con los valores que le corresponden
     vector = img.flatten()
@@ -89,19 +170,414 @@ def HuffmanEncoding(img):
     return comprimida, dicc, img.shape, size_in_bytes
 
 
-def HuffmanDec(comprimida, dicc, shape):
-    # Crear un diccionario inverso para decodificación
-    rev_dicc = {v: k for k, v in dicc.items()}
-    current_code = ""
-    descomprimida = []
+# Largo máximo de código que soporta el empaquetado vectorizado (un código
+# nunca ocupa más de dos palabras de 32 bits).
+MAX_PACK_BITS = 32
+
+# Mitad alta/baja de un uint64 visto como dos uint32 nativos
+_HI, _LO = (1, 0) if sys.byteorder == "little" else (0, 1)
+
+
+def code_tables(dicc, size=None):
+    """
+    Pasa el diccionario {símbolo: '0101'} a dos tablas indexadas por símbolo:
+    valor del código (uint64) y largo en bits (int64, 0 = símbolo sin código).
+    Por defecto las tablas tienen 256 entradas o las que pida el mayor símbolo.
+    """
+    if size is None:
+        size = max(256, max(dicc, default=0) + 1)
+    codes = np.zeros(size, dtype=np.uint64)
+    lengths = np.zeros(size, dtype=np.int64)
+    for sym, code in dicc.items():
+        codes[int(sym)] = int(code, 2) if code else 0
+        lengths[int(sym)] = len(code)
+    return codes, lengths
+
+
+def canonical_codes(lengths):
+    """
+    Códigos canónicos a partir de los largos: se asignan en orden de
+    (largo, símbolo), así alcanza con guardar los largos para reconstruirlos.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    codes = np.zeros(len(lengths), dtype=np.uint64)
+    used = np.flatnonzero(lengths)
+    if used.size == 0:
+        return codes
+    order = used[np.lexsort((used, lengths[used]))]
+    lens = lengths[order]
+
+    # Primer código de cada largo (como en DEFLATE) + posición dentro del largo
+    per_len = np.bincount(lens, minlength=int(lens[-1]) + 1)
+    first = np.zeros(len(per_len), dtype=np.uint64)
+    code = 0
+    for L in range(1, len(per_len)):
+        code = (code + int(per_len[L - 1])) << 1
+        first[L] = code
+    first_pos = np.cumsum(per_len) - per_len
+    rank = np.arange(order.size) - first_pos[lens]
+    codes[order] = first[lens] + rank.astype(np.uint64)
+    return codes
+
+
+def codes_to_dict(codes, lengths):
+    """Inversa de `code_tables`: {símbolo: '0101'} para los símbolos con código."""
+    return {
+        int(sym): format(int(codes[sym]), f"0{int(lengths[sym])}b")
+        for sym in np.flatnonzero(lengths)
+    }
+
+
+class BitWriter:
+    """
+    Empaqueta códigos de Huffman directamente a bytes (MSB primero) sin armar
+    el string de '0'/'1'.
+
+    Los píxeles uint8 se traducen de a pares con una tabla de 65536 entradas
+    (código concatenado + largo), lo que reduce a la mitad el trabajo por
+    píxel. Cada código se ubica en la ventana de 64 bits que arranca en su
+    palabra de 32 bits y las palabras se arman con `np.bincount` (los bits de
+    distintos códigos no se solapan, así que sumar equivale a OR). Se puede
+    llamar a `write` varias veces con bloques consecutivos de símbolos.
+    """
+
+    def __init__(self, codes: np.ndarray, lengths: np.ndarray, chunk: int = 1 << 14):
+        if int(lengths.max(initial=0)) > MAX_PACK_BITS:
+            raise ValueError(f"Código de Huffman de más de {MAX_PACK_BITS} bits.")
+
+        lengths = lengths.astype(np.uint64)
+        used = lengths > 0
+        # Códigos alineados a la izquierda en 64 bits
+        aligned = np.zeros(len(codes), dtype=np.uint64)
+        aligned[used] = codes.astype(np.uint64)[used] << (np.uint64(64) - lengths[used])
+        self._single = (lengths, aligned)
+
+        self._pairs = None
+        if len(codes) == 256:
+            # Índice del par (a, b) leído como '<u2': a + 256 * b
+            pair_len = lengths[None, :] + lengths[:, None]
+            pair_len[~(used[None, :] & used[:, None])] = 0
+            pair_code = aligned[None, :] | (aligned[:, None] >> lengths[None, :])
+            self._pairs = (pair_len.ravel(), pair_code.ravel())
+
+        self._chunk = int(chunk)
+        self.reset()
+
+    def reset(self) -> None:
+        """Descarta lo escrito (las tablas se reusan, p. ej. para la franja siguiente)."""
+        self._out = bytearray()
+        self._tail = 0  # palabra de 32 bits incompleta (bits en la parte alta)
+        self.bit_count = 0
+
+    def write(self, symbols: np.ndarray) -> None:
+        symbols = np.ascontiguousarray(symbols).ravel()
+        if self._pairs is not None and symbols.dtype == np.uint8:
+            n_pairs = symbols.size // 2
+            pairs = symbols[: 2 * n_pairs].view("<u2")
+            for i in range(0, n_pairs, self._chunk):
+                self._write_chunk(pairs[i : i + self._chunk], *self._pairs)
+            symbols = symbols[2 * n_pairs :]
+        for i in range(0, symbols.size, self._chunk):
+            self._write_chunk(symbols[i : i + self._chunk], *self._single)
+
+    def _write_chunk(self, idx: np.ndarray, lengths: np.ndarray, aligned: np.ndarray) -> None:
+        if idx.size == 0:
+            return
+        lens = np.take(lengths, idx)
+        if not lens.all():
+            raise ValueError("La imagen tiene valores sin código de Huffman.")
+
+        # Posición (en bits) de cada código, relativa a la palabra incompleta
+        tail_bits = self.bit_count & 31
+        end = np.cumsum(lens)
+        end += np.uint64(tail_bits)
+        start = end - lens
+        total = int(end[-1])
+
+        # Cada código queda dentro de la ventana de 64 bits que empieza en su palabra
+        code = np.take(aligned, idx)
+        offset = start & np.uint64(31)
+        vals = (code >> offset).view(np.uint32)
+        word = (start >> np.uint64(5)).astype(np.intp)
+
+        nwords = (total + 31) >> 5
+        words = np.bincount(word, weights=vals[_HI::2], minlength=nwords + 2)
+        words += np.bincount(word + 1, weights=vals[_LO::2], minlength=nwords + 2)
+
+        # Un par de códigos largos puede no entrar en la ventana: lo que sobra va
+        # a la palabra siguiente (son casos raros, se resuelven aparte).
+        spill = np.flatnonzero(lens + offset > np.uint64(64))
+        if spill.size:
+            rest = code[spill] << (np.uint64(64) - offset[spill])
+            np.add.at(words, word[spill] + 2, (rest >> np.uint64(32)).astype(np.float64))
 
-    for bit in comprimida:
-        current_code += bit
-        if current_code in rev_dicc:
-            descomprimida.append(rev_dicc[current_code])
-            current_code = ""
+        words = words[:nwords].astype(np.uint32)
+        words[0] |= np.uint32(self._tail)
 
-    # Convertir la lista de valores a una matriz con la forma original
-    descomprimida = np.array(descomprimida, dtype=np.uint8).reshape(shape)
+        full = total >> 5
+        self._out += words[:full].astype(">u4").tobytes()
+        self._tail = int(words[full]) if full < nwords else 0
+        self.bit_count += total - tail_bits
 
-    return descomprimida
+    def getvalue(self):
+        """Devuelve (bytes, padding_bits) con lo escrito hasta el momento."""
+        tail_bits = self.bit_count & 31
+        data = bytes(self._out) + self._tail.to_bytes(4, "big")[: (tail_bits + 7) // 8]
+        return data, (8 - self.bit_count % 8) % 8
+
+
+def pack_symbols(symbols, dicc):
+    """
+    Codifica un array de símbolos con el diccionario de Huffman.
+    Devuelve (bytes, padding_bits), igual que empaquetar el string de HuffmanEncoding.
+    """
+    codes, lengths = code_tables(dicc)
+    writer = BitWriter(codes, lengths)
+    writer.write(symbols)
+    return writer.getvalue()
+
+
+# La LUT cubre todos los códigos si no pasan de LUT_MAX_BITS (16: alfabetos de
+# 16 bits con más de 2**15 valores); si no (p. ej. HUF1), LUT de LUT_BITS bits
+LUT_MAX_BITS = 16
+LUT_BITS = 12
+
+# Decodificación por carriles: el bitstream se parte en bloques que se decodifican
+# a la vez (un elemento de array por bloque). Cada carril arranca GUARD_BITS antes
+# de su bloque para sincronizarse con los límites de código (Huffman se
+# resincroniza en pocos códigos); si no coincide con el carril anterior se
+# vuelve a decodificar desde la posición exacta.
+_MIN_BLOCK_BITS = 1024
+_MAX_LANES = 8192
+GUARD_BITS = 512
+
+
+class HuffmanTable:
+    """
+    Tablas de decodificación: una LUT de `lut_bits` bits (símbolo + largo) para
+    los códigos cortos y, para los códigos más largos que la LUT, una lista
+    ordenada de códigos por largo. Si los códigos no superan LUT_MAX_BITS
+    la LUT los cubre a todos.
+    """
+
+    def __init__(self, codes: np.ndarray, lengths: np.ndarray, lut_bits=None, dtype=np.uint8):
+        codes = np.asarray(codes, dtype=np.uint64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        used = np.flatnonzero(lengths)
+        if used.size == 0:
+            raise ValueError("Tabla de Huffman vacía.")
+        self.max_len = int(lengths[used].max())
+        if self.max_len > MAX_PACK_BITS:
+            raise ValueError(f"Código de Huffman de más de {MAX_PACK_BITS} bits.")
+        self.min_len = int(lengths[used].min())
+
+        if lut_bits is None:
+            # Con largos acotados la LUT cubre todos los códigos (2**16 entradas como mucho)
+            lut_bits = self.max_len if self.max_len <= LUT_MAX_BITS else LUT_BITS
+        k = min(int(lut_bits), self.max_len)
+        self.lut_bits = k
+        self.lut_len = np.zeros(1 << k, dtype=np.uint8)
+        self.lut_sym = np.zeros(1 << k, dtype=dtype)
+
+        # Cada código corto ocupa en la LUT el rango de los k bits que lo tienen de prefijo
+        short = used[lengths[used] <= k]
+        span = np.left_shift(1, k - lengths[short])
+        lo = (codes[short] << (k - lengths[short]).astype(np.uint64)).astype(np.int64)
+        idx = np.repeat(lo - (np.cumsum(span) - span), span) + np.arange(int(span.sum()))
+        self.lut_len[idx] = np.repeat(lengths[short], span)
+        self.lut_sym[idx] = np.repeat(short, span)
+
+        self.long = []  # [(largo, códigos ordenados, símbolos)]
+        for L in range(k + 1, self.max_len + 1):
+            syms = used[lengths[used] == L]
+            if syms.size:
+                order = np.argsort(codes[syms])
+                self.long.append((L, codes[syms][order], syms[order].astype(dtype)))
+
+        # Si la LUT no cubre todos los prefijos hay que revisar cada paso
+        self.checked = bool(self.long) or not self.lut_len.all()
+
+    @classmethod
+    def from_dict(cls, dicc, **kwargs) -> "HuffmanTable":
+        return cls(*code_tables(dicc), **kwargs)
+
+    def _resolve(self, win: np.ndarray, lens: np.ndarray, syms: np.ndarray) -> None:
+        """Completa (in-place) los carriles cuyo código no entra en la LUT."""
+        pend = np.flatnonzero(lens == 0)
+        for L, codes, symbols in self.long:
+            if pend.size == 0:
+                break
+            prefix = win[pend] >> np.uint64(32 - L)
+            i = np.minimum(np.searchsorted(codes, prefix), len(codes) - 1)
+            hit = codes[i] == prefix
+            lens[pend[hit]] = L
+            syms[pend[hit]] = symbols[i[hit]]
+            pend = pend[~hit]
+        if pend.size:
+            raise ValueError("Bitstream de Huffman corrupto (código inexistente).")
+
+
+def _words64(data) -> np.ndarray:
+    """
+    Para cada palabra de 32 bits (big-endian) del payload devuelve esa palabra
+    y la siguiente en un uint64: cualquier ventana de 32 bits sale de un acceso.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    n32 = (buf.size + 3) // 4 + 2
+    padded = np.zeros(n32 * 4, dtype=np.uint8)
+    padded[: buf.size] = buf
+    w = padded.view(">u4").astype(np.uint64)
+    return (w[:-1] << np.uint64(32)) | w[1:]
+
+
+def _run_lanes(words, table, start, rec_end, stride):
+    """
+    Decodifica en paralelo un carril por posición de `start`, hasta que cada uno
+    llega a `rec_end`. Devuelve (buf, counts, exits): los símbolos del paso i de
+    cada carril en la fila i de `buf`, cuántos decodificó cada uno y la posición
+    del primer código >= rec_end.
+    """
+    n_lanes = start.size
+    buf = np.empty((stride, n_lanes), dtype=table.lut_sym.dtype)
+    counts = np.zeros(n_lanes, dtype=np.int64)
+    exits = start.astype(np.uint64)
+
+    lane = np.arange(n_lanes)
+    pos = start.astype(np.uint64)
+    end = rec_end.astype(np.uint64)
+    live = pos < end
+    if not live.all():
+        lane, pos, end = lane[live], pos[live], end[live]
+
+    shift = np.uint64(64 - table.lut_bits)
+    step = 0
+    while lane.size:
+        if step >= stride:
+            raise ValueError("Bitstream de Huffman corrupto (demasiados símbolos).")
+        win = words[pos >> np.uint64(5)] << (pos & np.uint64(31))
+        top = win >> shift
+        lens = table.lut_len[top]
+        syms = table.lut_sym[top]
+        if table.checked and not lens.all():
+            table._resolve(win >> np.uint64(32), lens, syms)
+
+        buf[step, lane] = syms
+        pos += lens
+        step += 1
+
+        done = pos >= end
+        if done.any():
+            fin = lane[done]
+            counts[fin] = step
+            exits[fin] = pos[done]
+            keep = ~done
+            lane, pos, end = lane[keep], pos[keep], end[keep]
+
+    return buf, counts, exits
+
+
+def _sync_lanes(words, table, start, target):
+    """Avanza cada carril código por código hasta la primera posición >= target."""
+    pos = start.astype(np.uint64)
+    target = target.astype(np.uint64)
+    shift = np.uint64(64 - table.lut_bits)
+    act = np.flatnonzero(pos < target)
+    while act.size:
+        p = pos[act]
+        win = words[p >> np.uint64(5)] << (p & np.uint64(31))
+        top = win >> shift
+        lens = table.lut_len[top]
+        if table.checked and not lens.all():
+            table._resolve(win >> np.uint64(32), lens, table.lut_sym[top])
+        pos[act] = p + lens
+        act = act[pos[act] < target[act]]
+    return pos
+
+
+def decode_symbols(data, table: HuffmanTable, out: np.ndarray, bit_start: int = 0, bit_end=None) -> np.ndarray:
+    """
+    Decodifica exactamente `out.size` símbolos de los bits [bit_start, bit_end)
+    de `data` (bytes empaquetados MSB primero) y los escribe en `out`.
+    """
+    if bit_end is None:
+        bit_end = len(data) * 8
+    flat = out.reshape(-1)
+    _decode_segments(_words64(data), table, flat, [bit_start], [bit_end], [flat.size])
+    return out
+
+
+def decode_segments(data, table: HuffmanTable, out: np.ndarray, starts, ends, sizes) -> np.ndarray:
+    """
+    Decodifica varios bitstreams independientes de `data`: el segmento i ocupa los
+    bits [starts[i], ends[i]) y aporta sizes[i] símbolos, escritos en orden en `out`.
+    Todos los segmentos se decodifican juntos en los mismos carriles.
+    """
+    _decode_segments(_words64(data), table, out.reshape(-1), starts, ends, sizes)
+    return out
+
+
+def _decode_segments(words, table, flat, starts, ends, sizes):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    seg_bits = ends - starts
+    if (seg_bits < 0).any() or int(sizes.sum()) != flat.size:
+        raise ValueError("Bitstream de Huffman corrupto (segmentos inválidos).")
+
+    block = max(_MIN_BLOCK_BITS, -(-int(seg_bits.sum()) // _MAX_LANES))
+    block = -(-block // 32) * 32
+    stride = block // table.min_len + 1
+
+    # Bloques de cada segmento; el primero de cada uno arranca en una posición exacta
+    n_blocks = np.maximum(1, -(-seg_bits // block))
+    first_idx = np.cumsum(n_blocks) - n_blocks
+    seg = np.repeat(np.arange(starts.size), n_blocks)
+    first = np.zeros(seg.size, dtype=bool)
+    first[first_idx] = True
+    rec_start = starts[seg] + (np.arange(seg.size) - first_idx[seg]) * block
+    rec_end = np.minimum(rec_start + block, ends[seg])
+
+    # El resto se sincroniza desde GUARD_BITS antes de su bloque
+    run_start = np.where(first, rec_start, np.maximum(rec_start - GUARD_BITS, starts[seg]))
+    entry = _sync_lanes(words, table, run_start, rec_start)
+    buf, counts, exits = _run_lanes(words, table, entry, rec_end, stride)
+
+    # Donde la sincronización no coincidió con el carril anterior, se repite
+    # desde la posición exacta.
+    while True:
+        bad = np.flatnonzero(~first[1:] & (exits[:-1] != entry[1:])) + 1
+        if bad.size == 0:
+            break
+        entry[bad] = exits[bad - 1]
+        sub_buf, sub_counts, sub_exits = _run_lanes(words, table, entry[bad], rec_end[bad], stride)
+        buf[:, bad] = sub_buf
+        counts[bad] = sub_counts
+        exits[bad] = sub_exits
+
+    last_idx = first_idx + n_blocks - 1
+    if (exits[last_idx] != ends.astype(np.uint64)).any() or (np.add.reduceat(counts, first_idx) != sizes).any():
+        raise ValueError("Bitstream de Huffman corrupto (largo inesperado).")
+
+    # Carril por carril, en orden: es el orden original de los símbolos
+    mask = np.arange(stride) < counts[:, None]
+    np.compress(mask.ravel(), buf.T.ravel(), out=flat)
+
+
+def unpack_symbols(data: bytes, padding_bits: int, dicc, shape) -> np.ndarray:
+    """
+    Inversa de `pack_symbols`: decodifica los bytes empaquetados a un array uint8
+    (uint16 si hay símbolos > 255) de forma `shape`, sin pasar por el string de bits.
+    """
+    dtype = np.uint16 if max(dicc, default=0) > 0xFF else np.uint8
+    out = np.empty(shape, dtype=dtype)
+    if out.size == 0:
+        return out
+    table = HuffmanTable.from_dict(dicc, dtype=dtype)
+    return decode_symbols(data, table, out, 0, len(data) * 8 - int(padding_bits))
+
+
+def HuffmanDec(comprimida, dicc, shape):
+    # El string de '0'/'1' se empaqueta a bytes y se decodifica con la tabla
+    bits = np.frombuffer(comprimida.encode("ascii"), dtype=np.uint8) == ord("1")
+    data = np.packbits(bits).tobytes()
+    return unpack_symbols(data, (8 - bits.size % 8) % 8, dicc, shape)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Predictores sin pérdida: se codifican los residuos (pixel - predicción) mod 2**bits
+# (256 para uint8; para 12/16 bits quedan uint16).
+#   left: a (vecino izquierdo)   up: b (vecino de arriba)   avg: (a + b) // 2
+#   med:  predictor MED de LOCO-I/JPEG-LS, mediana(a, b, a + b - c) con c = arriba-izquierda
+# Bordes: la primera fila de cada bloque usa left (0 en la esquina) y la primera
+# columna usa up, así cada bloque de `block_rows` filas se reconstruye solo.
+PREDICTORS = {"none": 0, "left": 1, "up": 2, "avg": 3, "med": 4}
+
+
+def predictor_id(predictor) -> int:
+    """Acepta nombre ("med") o id (4); None equivale a "none"."""
+    if predictor is None:
+        return 0
+    if isinstance(predictor, str):
+        if predictor not in PREDICTORS:
+            raise ValueError(f"Predictor desconocido: {predictor!r} (opciones: {', '.join(PREDICTORS)}).")
+        return PREDICTORS[predictor]
+    if int(predictor) not in PREDICTORS.values():
+        raise ValueError(f"Predictor desconocido: {predictor!r}.")
+    return int(predictor)
+
+
+def _predict(a: np.ndarray, b: np.ndarray, c: np.ndarray, predictor: int) -> np.ndarray:
+    """Predicción interior (int16) a partir de izquierda, arriba y arriba-izquierda."""
+    if predictor == 1:
+        return a
+    if predictor == 2:
+        return b
+    if predictor == 3:
+        return (a + b) >> 1
+    return np.clip(a + b - c, np.minimum(a, b), np.maximum(a, b))
+
+
+def _work_dtype(bits: int):
+    # a + b - c tiene que entrar sin desbordar
+    return np.int16 if bits <= 8 else np.int32
+
+
+def _symbol_dtype(bits: int):
+    return np.uint8 if bits <= 8 else np.uint16
+
+
+def residuals(img: np.ndarray, predictor, block_rows: int = 0, bits: int = 8) -> np.ndarray:
+    """Residuos de `img` (2D, muestras de `bits` bits) con el predictor dado."""
+    predictor = predictor_id(predictor)
+    if predictor == 0 or img.size == 0:
+        return img
+    h, w = img.shape
+    block_rows = block_rows if block_rows > 0 else h
+    x = img.astype(_work_dtype(bits))
+
+    a = np.zeros_like(x)
+    a[:, 1:] = x[:, :-1]
+    b = np.zeros_like(x)
+    b[1:] = x[:-1]
+    c = np.zeros_like(x)
+    c[1:, 1:] = x[:-1, :-1]
+    pred = _predict(a, b, c, predictor).copy()  # left/up devuelven `a`/`b` tal cual
+    pred[:, 0] = b[:, 0]
+    first = slice(0, h, block_rows)
+    pred[first] = a[first]
+    x -= pred
+    x &= (1 << bits) - 1
+    return x.astype(_symbol_dtype(bits))
+
+
+def reconstruct(res: np.ndarray, predictor, block_rows: int = 0, bits: int = 8) -> np.ndarray:
+    """
+    Inversa de `residuals`. Bordes con cumsum; left/up son sumas acumuladas por
+    fila/columna y avg/med se resuelven por antidiagonales (todos los bloques a la vez).
+    """
+    predictor = predictor_id(predictor)
+    if predictor == 0 or res.size == 0:
+        return res
+    h, w = res.shape
+    block_rows = block_rows if block_rows > 0 else h
+    n_blocks = -(-h // block_rows)
+    # Las sumas acumuladas desbordan mod 2**8 / 2**16; con otros bits se enmascara
+    dtype = _symbol_dtype(bits)
+    mask = (1 << bits) - 1
+    r = np.zeros((n_blocks * block_rows, w), dtype=dtype)
+    r[:h] = res
+    r = r.reshape(n_blocks, block_rows, w)
+
+    # Primera columna de cada bloque (up) y primera fila (left)
+    if predictor != 2:
+        r[:, :, 0] = np.cumsum(r[:, :, 0], axis=1, dtype=dtype) & mask
+    if predictor != 1:
+        r[:, 0, 1:] = np.cumsum(r[:, 0], axis=1, dtype=dtype)[:, 1:] & mask
+    if predictor == 1:
+        out = np.cumsum(r, axis=2, dtype=dtype)
+    elif predictor == 2:
+        out = np.cumsum(r, axis=1, dtype=dtype)
+    else:
+        out = _reconstruct_diagonals(r, predictor, bits)
+    if mask != np.iinfo(dtype).max:
+        out &= mask
+    return out.reshape(-1, w)[:h]
+
+
+def _reconstruct_diagonals(r: np.ndarray, predictor: int, bits: int) -> np.ndarray:
+    # diag[k, y + x, y] = bloque k en (y, x): izquierda, arriba y arriba-izquierda
+    # quedan en las dos antidiagonales anteriores, en tramos contiguos.
+    n_blocks, rows, w = r.shape
+    mask = (1 << bits) - 1
+    diag = np.zeros((n_blocks, rows + w - 1, rows), dtype=_work_dtype(bits))
+    s = diag.strides
+    view = as_strided(diag, shape=r.shape, strides=(s[0], s[1] + s[2], s[1]), writeable=True)
+    view[...] = r
+
+    for d in range(2, rows + w - 1):
+        lo, hi = max(1, d - w + 1), min(rows - 1, d - 1) + 1
+        if lo >= hi:
+            continue
+        a = diag[:, d - 1, lo:hi]
+        b = diag[:, d - 1, lo - 1 : hi - 1]
+        c = diag[:, d - 2, lo - 1 : hi - 1]
+        cur = diag[:, d, lo:hi]
+        cur += _predict(a, b, c, predictor)
+        cur &= mask
+    return view.astype(r.dtype)
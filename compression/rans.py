@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from typing import List, Tuple
+
+import numpy as np
+
+# rANS estático con estado de 32 bits que se renormaliza de a 16 bits
+# (a lo sumo una palabra por símbolo en cada dirección). Las frecuencias se
+# cuantizan para sumar 2**prob_bits.
+#
+# Cada franja es un stream independiente con `lanes` estados intercalados: el
+# símbolo i de la franja va al carril i % lanes, así en cada paso se avanza un
+# símbolo en todos los carriles (de todas las franjas) con operaciones de NumPy.
+# Stream de una franja (palabras uint16 little-endian):
+#   estado final de cada carril (parte alta, parte baja), y después las palabras
+#   de renormalización en el orden en que las lee el decoder (paso, carril).
+PROB_BITS = 15
+RANS_L = 1 << 16
+LANES = 32
+
+
+def normalize_freqs(hist: np.ndarray, prob_bits: int = PROB_BITS) -> np.ndarray:
+    """Cuantiza un histograma a frecuencias que suman 2**prob_bits (>= 1 si el símbolo aparece)."""
+    total = 1 << prob_bits
+    hist = np.asarray(hist, dtype=np.int64)
+    if np.count_nonzero(hist) > total:
+        raise ValueError(f"prob_bits={prob_bits} no alcanza para {np.count_nonzero(hist)} símbolos.")
+    freqs = np.zeros(len(hist), dtype=np.int64)
+    if hist.sum() == 0:
+        freqs[0] = total
+        return freqs.astype(np.uint32)
+
+    used = hist > 0
+    freqs[used] = np.maximum(1, np.round(hist[used] * total / hist.sum())).astype(np.int64)
+    diff = total - int(freqs.sum())
+    if diff > 0:
+        freqs[np.argmax(hist)] += diff
+    while diff < 0:
+        # Se les saca a los más frecuentes (cuesta menos bits) sin bajar de 1
+        order = np.argsort(-freqs, kind="stable")
+        order = order[freqs[order] > 1][: -diff]
+        freqs[order] -= 1
+        diff += len(order)
+    return freqs.astype(np.uint32)
+
+
+def _tables(freqs: np.ndarray, prob_bits: int):
+    """Por slot (0..2**prob_bits-1): símbolo, frecuencia y slot - acumulada."""
+    cum = np.concatenate(([0], np.cumsum(freqs)[:-1])).astype(np.uint32)
+    slot_sym = np.repeat(np.arange(len(freqs), dtype=np.int64), freqs)
+    slot_freq = freqs[slot_sym].astype(np.uint32)
+    slot_bias = (np.arange(1 << prob_bits, dtype=np.uint32) - cum[slot_sym]).astype(np.uint32)
+    return cum, slot_sym, slot_freq, slot_bias
+
+
+def _lane_layout(sizes: np.ndarray, lanes: int):
+    steps = int(-(-int(sizes.max()) // lanes)) if len(sizes) else 0
+    # Primer paso en el que alguna franja ya no tiene símbolo en todos los carriles
+    full_steps = int(sizes.min()) // lanes if len(sizes) else 0
+    return steps, full_steps
+
+
+def encode_streams(
+    symbols: np.ndarray, sizes: np.ndarray, freqs: np.ndarray, prob_bits: int = PROB_BITS, lanes: int = LANES
+) -> List[Tuple[bytes, int]]:
+    """
+    Codifica `symbols` (franjas consecutivas de `sizes` símbolos) en un stream
+    por franja. Devuelve [(bytes, bits)] como huffman_codec._encode_stripes.
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    n = len(sizes)
+    steps, full_steps = _lane_layout(sizes, lanes)
+    padded = np.zeros((n, steps * lanes), dtype=symbols.dtype)
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    for s in range(n):
+        padded[s, : sizes[s]] = symbols[offsets[s] : offsets[s + 1]]
+    padded = padded.reshape(n, steps, lanes)
+
+    cum, _, _, _ = _tables(freqs, prob_bits)
+    freqs = freqs.astype(np.uint32)
+    lane_idx = np.arange(lanes)
+    shift = np.uint32(32 - prob_bits)
+    x = np.full((n, lanes), RANS_L, dtype=np.uint32)
+    words = np.empty((n, steps, lanes), dtype="<u2")
+    emitted = np.zeros((n, steps, lanes), dtype=bool)
+
+    # El encoder recorre los símbolos al revés; las palabras quedan guardadas
+    # en la posición (paso, carril) donde el decoder las va a leer.
+    for t in range(steps - 1, -1, -1):
+        sym = padded[:, t]
+        f = freqs[sym]
+        if t >= full_steps:
+            active = t * lanes + lane_idx < sizes[:, None]
+            f = np.where(active, f, np.uint32(1))
+        emit = (x >> shift) >= f
+        if t >= full_steps:
+            emit &= active
+        words[:, t] = x
+        emitted[:, t] = emit
+        x = np.where(emit, x >> np.uint32(16), x)
+        q, r = np.divmod(x, f)
+        new_x = (q << np.uint32(prob_bits)) + r + cum[sym]
+        x = new_x if t < full_steps else np.where(active, new_x, x)
+
+    head = np.empty((n, lanes, 2), dtype="<u2")
+    head[:, :, 0] = x >> np.uint32(16)
+    head[:, :, 1] = x
+    counts = emitted.sum(axis=(1, 2))
+    body = words[emitted]
+    out = []
+    start = 0
+    for s in range(n):
+        data = head[s].tobytes() + body[start : start + counts[s]].tobytes()
+        start += counts[s]
+        out.append((data, 8 * len(data)))
+    return out
+
+
+def decode_streams(
+    data,
+    freqs: np.ndarray,
+    out: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    sizes: np.ndarray,
+    prob_bits: int = PROB_BITS,
+    lanes: int = LANES,
+) -> np.ndarray:
+    """
+    Decodifica franjas consecutivas de `data` ([starts, ends) en bits, alineados
+    a 16) en `out` (plano, sizes[i] símbolos por franja).
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    n = len(sizes)
+    if n == 0:
+        return out
+    if np.any(starts % 16) or np.any(ends % 16) or np.any(ends - starts < 32 * lanes):
+        raise ValueError("Archivo .huf corrupto (stream rANS inválido).")
+    nbytes = (int(ends.max()) + 7) // 8
+    words = np.zeros(nbytes // 2 + lanes, dtype=np.uint32)
+    words[: nbytes // 2] = np.frombuffer(data, dtype="<u2", count=nbytes // 2)
+
+    _, slot_sym, slot_freq, slot_bias = _tables(freqs, prob_bits)
+    steps, full_steps = _lane_layout(sizes, lanes)
+    lane_idx = np.arange(lanes)
+    head = starts[:, None] // 16 + 2 * lane_idx
+    x = (words[head] << np.uint32(16)) | words[head + 1]
+    ptr = starts // 16 + 2 * lanes
+    mask = np.uint32((1 << prob_bits) - 1)
+    buf = np.empty((n, steps, lanes), dtype=out.dtype)
+
+    for t in range(steps):
+        slot = x & mask
+        buf[:, t] = slot_sym[slot]
+        new_x = slot_freq[slot] * (x >> np.uint32(prob_bits)) + slot_bias[slot]
+        need = new_x < RANS_L
+        if t >= full_steps:
+            active = t * lanes + lane_idx < sizes[:, None]
+            need &= active
+            new_x = np.where(active, new_x, x)
+        pos = np.cumsum(need, axis=1)
+        w = words[ptr[:, None] + pos - 1]
+        x = np.where(need, (new_x << np.uint32(16)) | w, new_x)
+        ptr += pos[:, -1]
+
+    # Al terminar, cada carril vuelve al estado inicial del encoder
+    if np.any(ptr != ends // 16) or np.any(x != RANS_L):
+        raise ValueError("Archivo .huf corrupto (stream rANS inválido).")
+    buf = buf.reshape(n, steps * lanes)
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    for s in range(n):
+        out[offsets[s] : offsets[s + 1]] = buf[s, : sizes[s]]
+    return out
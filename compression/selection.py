@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from compression.codecs import HUFFMAN, RAW, RLE, RLE_MAX_RUN, Codec
+from compression.huffman_core import MAX_CODE_LENGTH, bit_depth, code_lengths, histograma, length_limit
+from compression.prediction import predictor_id, residuals
+
+# Modo "auto" (codec="auto"): se estima en una muestra de bloques de filas cuánto
+# ocuparía la imagen con cada opción y se usa la más chica. El codec y el predictor
+# elegidos quedan en el archivo como siempre (chunks CODC y PRED).
+AUTO = "auto"
+# Pixeles de la muestra: bloques cortos repartidos a lo alto de la imagen (así una
+# banda vacía arriba o un marco negro no deciden solos), con un mínimo de bloques
+# aunque la imagen sea muy ancha
+AUTO_SAMPLE_PIXELS = 1 << 18
+AUTO_BLOCK_ROWS = 8
+AUTO_MIN_BLOCKS = 64
+# Si lo mejor no baja de esta fracción de los datos crudos, se guarda crudo
+AUTO_MIN_RATIO = 0.97
+
+
+@dataclass
+class CompressionEstimate:
+    entropy: float  # bits/pixel, orden cero sobre los pixeles
+    residual_entropy: float  # bits/pixel de los residuos del predictor
+    run_ratio: float  # runs / pixeles (en orden raster)
+    sizes: Dict[str, int]  # bytes estimados: "raw", "rle", "huffman", "huffman+pred"
+
+
+def _entropy(hist: np.ndarray) -> float:
+    p = hist[hist > 0] / hist.sum()
+    return float(-(p * np.log2(p)).sum())
+
+
+def _huffman_bytes(hist: np.ndarray) -> float:
+    lengths = code_lengths(hist, length_limit(hist, MAX_CODE_LENGTH))
+    return (float(np.dot(hist, lengths)) + 8 * np.count_nonzero(lengths)) / 8
+
+
+def _n_blocks(width: int, max_pixels: int) -> int:
+    return max(AUTO_MIN_BLOCKS, max_pixels // (AUTO_BLOCK_ROWS * max(1, width)))
+
+
+def _sample_blocks(img: np.ndarray, max_pixels: int) -> Optional[np.ndarray]:
+    """
+    Bloques (k, 1 + AUTO_BLOCK_ROWS, w) repartidos a lo alto de `img`; la primera
+    fila de cada bloque es solo contexto del predictor. None si la muestra sería
+    casi toda la imagen (entonces conviene estimar sobre la imagen entera).
+    """
+    h, w = img.shape
+    win = AUTO_BLOCK_ROWS + 1
+    k = _n_blocks(w, max_pixels)
+    if k * win >= h:
+        return None
+    starts = np.unique(np.linspace(0, h - win, k).astype(np.int64))
+    return img[starts[:, None] + np.arange(win)]
+
+
+def _run_lengths(rows: np.ndarray) -> np.ndarray:
+    """Largos de los runs en orden raster de cada fila de `rows` (2D) por separado."""
+    change = np.ones(rows.shape, dtype=bool)
+    change[:, 1:] = rows[:, 1:] != rows[:, :-1]
+    starts = np.flatnonzero(change)
+    return np.diff(np.r_[starts, rows.size])
+
+
+def _estimate(
+    values: np.ndarray, res: np.ndarray, run_lengths: np.ndarray, n_pixels: int, item: int
+) -> CompressionEstimate:
+    scale = n_pixels / max(1, values.size)
+    hist = histograma(values)
+    res_hist = histograma(res)
+    runs = int((-(-run_lengths // RLE_MAX_RUN)).sum())
+    sizes = {
+        "raw": n_pixels * item,
+        "rle": int(runs * (item + 1) * scale),
+        "huffman": int(_huffman_bytes(hist) * scale),
+        "huffman+pred": int(_huffman_bytes(res_hist) * scale),
+    }
+    return CompressionEstimate(
+        entropy=_entropy(hist),
+        residual_entropy=_entropy(res_hist),
+        run_ratio=runs / max(1, values.size),
+        sizes=sizes,
+    )
+
+
+def _estimate_blocks(blocks: np.ndarray, n_pixels: int, predictor, bits: int) -> CompressionEstimate:
+    k, win, w = blocks.shape
+    # Cada bloque arranca con su fila de contexto: las demás se predicen con la de arriba
+    # como en la imagen entera, y la de contexto (predicha con left) se descarta
+    res = residuals(blocks.reshape(k * win, w), predictor, win, bits).reshape(k, win, w)[:, 1:]
+    body = blocks[:, 1:]
+    return _estimate(
+        body.reshape(-1, w), res.reshape(-1, w), _run_lengths(body.reshape(k, -1)), n_pixels, blocks.itemsize
+    )
+
+
+def estimate(img: np.ndarray, predictor, bits: int = 8, stripe_rows: int = 64) -> CompressionEstimate:
+    """Estadísticas y tamaños estimados de `img` (uint8/uint16) con cada opción del modo auto."""
+    blocks = _sample_blocks(img, AUTO_SAMPLE_PIXELS)
+    if blocks is not None:
+        return _estimate_blocks(blocks, img.size, predictor, bits)
+    res = residuals(img, predictor, stripe_rows, bits)
+    return _estimate(img, res, _run_lengths(img.reshape(1, -1)), img.size, img.dtype.itemsize)
+
+
+class RowSampler:
+    """
+    La misma muestra que `estimate` para una imagen que llega de a bloques de filas
+    (alto desconocido de antemano): se guarda un bloque cada `stride` filas y, cuando
+    sobran, se descarta uno de cada dos y se duplica el paso. La memoria queda
+    acotada por la muestra, no por la imagen.
+    """
+
+    def __init__(self, stripe_rows: int = 64, max_pixels: int = AUTO_SAMPLE_PIXELS):
+        self.stripe_rows = stripe_rows
+        self.max_pixels = max_pixels
+        self.h = self.w = 0
+        self.bits = 8
+        self.stride = AUTO_BLOCK_ROWS + 1
+        self._k = 0
+        self._head: Optional[List[np.ndarray]] = []  # filas enteras mientras la imagen sea chica
+        self._blocks: List[np.ndarray] = []
+        self._starts: List[int] = []
+        self._next = 0
+        self._carry: Optional[np.ndarray] = None
+
+    def add(self, rows: np.ndarray) -> None:
+        win = AUTO_BLOCK_ROWS + 1
+        if not self._k:
+            self.w = rows.shape[1]
+            self._k = _n_blocks(self.w, self.max_pixels)
+        if rows.dtype == np.uint16:
+            self.bits = max(self.bits, bit_depth(rows))
+        if self._head is not None:
+            self._head.append(rows)
+        base = self.h
+        if self._carry is not None:
+            base -= self._carry.shape[0]
+            rows = np.concatenate([self._carry, rows])
+        self.h = base + rows.shape[0]
+        if self.h > self._k * win:
+            self._head = None
+        while self._next + win <= self.h:
+            self._blocks.append(rows[self._next - base : self._next - base + win].copy())
+            self._starts.append(self._next)
+            self._next += self.stride
+            if len(self._blocks) > 2 * self._k:
+                self._blocks, self._starts = self._blocks[::2], self._starts[::2]
+                self.stride *= 2
+                self._next = self._starts[-1] + self.stride
+        self._carry = rows[-(win - 1) :].copy()
+
+    def estimate(self, predictor) -> CompressionEstimate:
+        if self._head is not None:
+            img = np.concatenate(self._head) if len(self._head) > 1 else self._head[0]
+            return estimate(img, predictor, self.bits, self.stripe_rows)
+        blocks = np.stack(self._blocks)
+        return _estimate_blocks(blocks, self.h * self.w, predictor, self.bits)
+
+
+def _choose(sizes: Dict[str, int], predictor: int) -> Tuple[Codec, int]:
+    options = {
+        "huffman+pred": (HUFFMAN, predictor),
+        "huffman": (HUFFMAN, 0),
+        "rle": (RLE, 0),
+    }
+    best = min(options, key=lambda k: sizes[k])
+    if sizes[best] > AUTO_MIN_RATIO * sizes["raw"]:
+        return RAW, 0
+    return options[best]
+
+
+def choose_codec(img: np.ndarray, predictor, bits: int = 8, stripe_rows: int = 64) -> Tuple[Codec, int]:
+    """(codec, predictor) para `img` según `estimate`; `predictor` es el que se prueba para Huffman."""
+    predictor = predictor_id(predictor)
+    if img.size == 0:
+        return HUFFMAN, predictor
+    return _choose(estimate(img, predictor, bits, stripe_rows).sizes, predictor)
+
+
+def choose_codec_rows(sampler: RowSampler, predictor) -> Tuple[Codec, int]:
+    """Como `choose_codec`, para una imagen recorrida de a bloques con un RowSampler."""
+    predictor = predictor_id(predictor)
+    if not sampler.h or not sampler.w:
+        return HUFFMAN, predictor
+    return _choose(sampler.estimate(predictor).sizes, predictor)
@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import sqlite3
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 DB_PATH = Path(__file__).parent / "app.db"
 
@@ -98,6 +100,22 @@ def init_db() -> None:
         """
     )
 
+    # Features del pipeline por estudio (vector float32 en un blob), una fila por
+    # versión del pipeline: con un modelo nuevo se re-puntúa sin tocar las imágenes
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS study_features (
+            study_id INTEGER NOT NULL,
+            pipeline_version INTEGER NOT NULL,
+            feature_names TEXT NOT NULL,
+            features BLOB NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            PRIMARY KEY (study_id, pipeline_version),
+            FOREIGN KEY (study_id) REFERENCES studies(id) ON DELETE CASCADE
+        );
+        """
+    )
+
     # Indexes
     cur.execute("CREATE INDEX IF NOT EXISTS idx_persons_dni ON persons(dni);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_persons_last_name ON persons(last_name);")
@@ -450,3 +468,138 @@ def get_study_by_id(study_id: int) -> Optional[Dict[str, Any]]:
     row = cur.fetchone()
     conn.close()
     return dict(row) if row else None
+
+
+def list_uncompressed_studies() -> List[Dict[str, Any]]:
+    """Estudios cuya imagen todavía no es un .huf (JPG/PNG originales o compresiones fallidas)."""
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id AS study_id, image_path
+        FROM studies
+        WHERE lower(image_path) NOT LIKE '%.huf'
+        ORDER BY id;
+        """
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def update_study_image_paths(updates: List[Tuple[int, str]]) -> None:
+    """Actualiza image_path de varios estudios en una sola transacción."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            """
+            UPDATE studies
+            SET image_path = ?,
+                updated_at = datetime('now')
+            WHERE id = ?;
+            """,
+            [(str(image_path), int(study_id)) for study_id, image_path in updates],
+        )
+    conn.close()
+
+
+def update_study_ml_results(updates: List[Tuple[int, str, Optional[float]]]) -> None:
+    """(study_id, model_label, model_score) de varios estudios en una sola transacción."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            """
+            UPDATE studies
+            SET model_label = ?,
+                model_score = ?,
+                updated_at = datetime('now')
+            WHERE id = ?;
+            """,
+            [
+                (label, float(score) if score is not None else None, int(study_id))
+                for study_id, label, score in updates
+            ],
+        )
+    conn.close()
+
+
+# ======================================================
+#  Features de estudios
+# ======================================================
+
+# Máximo de ids por consulta IN (...) (SQLite viejo limita a 999 parámetros)
+_IN_CHUNK = 900
+
+
+def _features_row(study_id: int, pipeline_version: int, features: Dict[str, float]) -> Tuple[int, int, str, bytes]:
+    names = ",".join(features)
+    blob = np.asarray(list(features.values()), dtype="<f4").tobytes()
+    return int(study_id), int(pipeline_version), names, blob
+
+
+def save_study_features(study_id: int, pipeline_version: int, features: Dict[str, float]) -> None:
+    """Guarda (o reemplaza) el vector de features de un estudio para esa versión del pipeline."""
+    save_study_features_many([(study_id, features)], pipeline_version)
+
+
+def save_study_features_many(rows: Iterable[Tuple[int, Dict[str, float]]], pipeline_version: int) -> None:
+    """Como save_study_features para varios estudios, en una sola transacción."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO study_features (study_id, pipeline_version, feature_names, features)
+            VALUES (?, ?, ?, ?);
+            """,
+            [_features_row(study_id, pipeline_version, f) for study_id, f in rows],
+        )
+    conn.close()
+
+
+def load_study_features(
+    pipeline_version: int,
+    study_ids: Optional[Sequence[int]] = None,
+    feature_names: Optional[Sequence[str]] = None,
+) -> Tuple[List[int], np.ndarray, List[str]]:
+    """
+    (ids, X, nombres): matriz float32 (n_estudios, n_features) de los estudios
+    que tienen features de esa versión (todos si `study_ids` es None; los que no
+    tienen se omiten, ver ids). Con `feature_names` las columnas salen en ese
+    orden y las que falten quedan en 0 (como el reindex de la inferencia).
+    """
+    conn = get_connection()
+    query = "SELECT study_id, feature_names, features FROM study_features WHERE pipeline_version = ?"
+    if study_ids is None:
+        rows = conn.execute(query + " ORDER BY study_id;", (int(pipeline_version),)).fetchall()
+    else:
+        ids = [int(i) for i in study_ids]
+        rows = []
+        for b in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[b : b + _IN_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows += conn.execute(
+                query + f" AND study_id IN ({marks}) ORDER BY study_id;", (int(pipeline_version), *chunk)
+            ).fetchall()
+    conn.close()
+
+    if feature_names is not None:
+        names = list(feature_names)
+    else:
+        names = rows[0]["feature_names"].split(",") if rows else []
+    X = np.zeros((len(rows), len(names)), dtype=np.float32)
+
+    # Normalmente todas las filas tienen los mismos nombres: un solo frombuffer por grupo
+    groups: Dict[str, List[int]] = {}
+    for i, r in enumerate(rows):
+        groups.setdefault(r["feature_names"], []).append(i)
+    col = {n: j for j, n in enumerate(names)}
+    for stored, idx in groups.items():
+        stored_names = stored.split(",")
+        block = np.frombuffer(b"".join(rows[i]["features"] for i in idx), dtype="<f4")
+        block = block.reshape(len(idx), len(stored_names))
+        pairs = [(k, col[n]) for k, n in enumerate(stored_names) if n in col]
+        if pairs:
+            src, dst = map(list, zip(*pairs))
+            X[np.ix_(idx, dst)] = block[:, src]
+
+    return [int(r["study_id"]) for r in rows], X, names
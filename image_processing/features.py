@@ -1,53 +1,82 @@
 from typing import Dict, Optional
+
+import cv2
 import numpy as np
-from scipy.stats import skew, kurtosis
-from skimage.feature import graycomatrix, graycoprops
+
+from image_processing.glcm import glcm_properties
+
+
+_VALUES = np.arange(256, dtype=np.float64)
 
 
-def _entropy_shannon_from_pixels(pixels: np.ndarray) -> float:
-    hist, _ = np.histogram(pixels, bins=256, range=(1, 255))
-    prob = hist / np.sum(hist)
+def _roi_histogram(img_roi: np.ndarray) -> np.ndarray:
+    """Cuentas de 0..255 de la ROI (uint8) en una pasada, sin copiar los pixeles."""
+    img_roi = np.asarray(img_roi)
+    if img_roi.dtype != np.uint8:
+        raise ValueError("extract_features espera una ROI uint8.")
+    return cv2.calcHist([np.ascontiguousarray(img_roi)], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+
+
+def _entropy_shannon_from_hist(hist: np.ndarray) -> float:
+    # Antes: np.histogram(pixels, bins=256, range=(1, 255)); cada bin tiene ancho < 1,
+    # así que cada valor 1..255 cae en su propio bin y da lo mismo que las cuentas
+    prob = hist[1:] / np.sum(hist[1:])
     prob = prob[prob > 0]
     return float(-np.sum(prob * np.log2(prob)))
 
 
-def extract_features(img_roi: np.ndarray) -> Optional[Dict[str, float]]:
-    pixels = img_roi[img_roi > 0]
-    if pixels.size == 0:
-        return None
+def _first_order_from_hist(hist: np.ndarray) -> Dict[str, float]:
+    """
+    mean, std, skew, kurtosis (Fisher, sesgados como scipy.stats), entropy, max y
+    min de los pixeles > 0, sacados de sus cuentas.
+    """
+    counts = hist.astype(np.float64)
+    counts[0] = 0
+    n = counts.sum()
+    mean = float(np.dot(counts, _VALUES) / n)
+    d = _VALUES - mean
+    wd2 = counts * d * d
+    m2 = wd2.sum() / n
+    m3 = np.dot(wd2, d) / n
+    m4 = np.dot(wd2, d * d) / n
+    # Como scipy.stats: sin varianza (todos los pixeles iguales) skew y kurtosis dan NaN
+    if m2 <= (np.finfo(np.float64).resolution * mean) ** 2:
+        skew_val = kurt_val = float("nan")
+    else:
+        skew_val = float(m3 / m2**1.5)
+        kurt_val = float(m4 / m2**2 - 3.0)
+    present = np.flatnonzero(counts)
+    return {
+        "mean": mean,
+        "std": float(np.sqrt(m2)),
+        "skew": skew_val,
+        "kurtosis": kurt_val,
+        "entropy": _entropy_shannon_from_hist(hist),
+        "max": float(present[-1]),
+        "min": float(present[0]),
+    }
 
-    entropy_val = _entropy_shannon_from_pixels(pixels)
 
-    hist_feats = {
-        "mean": float(np.mean(pixels)),
-        "std": float(np.std(pixels)),
-        "skew": float(skew(pixels)),
-        "kurtosis": float(kurtosis(pixels)),
-        "entropy": float(entropy_val),
-        "max": float(np.max(pixels)),
-        "min": float(np.min(pixels)),
-    }
+def extract_features(img_roi: np.ndarray, out: Optional[np.ndarray] = None) -> Optional[Dict[str, float]]:
+    """
+    Features de primer orden y de textura (GLCM) de la ROI. `out` es un buffer
+    opcional uint8 con la forma de la ROI para la imagen cuantizada a 32 niveles.
+    """
+    hist = _roi_histogram(img_roi)
+    if not hist[1:].any():
+        return None
+
+    hist_feats = _first_order_from_hist(hist)
 
     levels = 32
     scale = 256 // levels
-    img_binned = (img_roi // scale).astype(np.uint8)
-
-    glcm = graycomatrix(
-        img_binned,
-        distances=[1],
-        angles=[0, np.pi / 4, np.pi / 2, 3 * np.pi / 4],
-        levels=levels,
-        symmetric=True,
-        normed=True,
-    )
-
-    glcm_feats = {
-        "contrast": float(graycoprops(glcm, "contrast").mean()),
-        "dissimilarity": float(graycoprops(glcm, "dissimilarity").mean()),
-        "homogeneity": float(graycoprops(glcm, "homogeneity").mean()),
-        "energy": float(graycoprops(glcm, "energy").mean()),
-        "correlation": float(graycoprops(glcm, "correlation").mean()),
-        "asm": float(graycoprops(glcm, "ASM").mean()),
-    }
+    if out is None:
+        img_binned = (img_roi // scale).astype(np.uint8)
+    else:
+        img_binned = np.floor_divide(img_roi, scale, out=out)
+
+    # Mismos números que graycomatrix/graycoprops (4 ángulos, distancia 1, simétrica,
+    # normalizada) sobre toda la imagen, fondo incluido, como se entrenó el modelo
+    glcm_feats = glcm_properties(img_binned, levels)
 
     return {**hist_feats, **glcm_feats}
@@ -0,0 +1,79 @@
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+# GLCM simétrica y normalizada a distancia 1 en los cuatro ángulos (0, 45, 90 y
+# 135 grados), igual que skimage.feature.graycomatrix(..., symmetric=True,
+# normed=True): cada offset (fila, columna) empareja el pixel (r, c) con (r + dr, c + dc).
+OFFSETS = ((0, 1), (1, 1), (1, 0), (1, -1))
+GLCM_PROPS = ("contrast", "dissimilarity", "homogeneity", "energy", "correlation", "asm")
+
+
+def _pairs(img: np.ndarray, dr: int, dc: int):
+    h, w = img.shape
+    c0, c1 = max(0, -dc), min(w, w - dc)
+    return img[: h - dr, c0:c1], img[dr:, c0 + dc : c1 + dc]
+
+
+def glcm(img: np.ndarray, levels: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Matrices (4, levels, levels) de los cuatro offsets. Cada una es un
+    histograma 2D de los pares (vistas desplazadas de la imagen, sin copias).
+    Con `mask` solo cuentan los pares con los dos pixeles adentro.
+    """
+    img = np.ascontiguousarray(img, dtype=np.uint8)
+    if mask is not None:
+        mask = np.ascontiguousarray(mask, dtype=bool)
+    p = np.empty((4, levels, levels), dtype=np.float64)
+    for k, (dr, dc) in enumerate(OFFSETS):
+        pair_mask = None
+        if mask is not None:
+            ma, mb = _pairs(mask, dr, dc)
+            pair_mask = (ma & mb).view(np.uint8)
+        p[k] = cv2.calcHist(list(_pairs(img, dr, dc)), [0, 1], pair_mask, [levels, levels], [0, levels, 0, levels])
+    p += p.transpose(0, 2, 1)
+    total = p.sum(axis=(1, 2), keepdims=True)
+    return np.divide(p, total, out=np.zeros_like(p), where=total > 0)
+
+
+_WEIGHTS: Dict[int, np.ndarray] = {}
+
+
+def _weights(levels: int) -> np.ndarray:
+    # (4, levels, levels): (i-j)^2, |i-j|, 1/(1+(i-j)^2) e i*j, para sacar todo con un solo producto
+    if levels not in _WEIGHTS:
+        i = np.arange(levels, dtype=np.float64)
+        d = i[:, None] - i[None, :]
+        _WEIGHTS[levels] = np.stack([d**2, np.abs(d), 1.0 / (1.0 + d**2), i[:, None] * i[None, :]])
+    return _WEIGHTS[levels]
+
+
+def glcm_properties(img: np.ndarray, levels: int, mask: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """
+    Las seis propiedades de skimage.feature.graycoprops promediadas en los
+    cuatro ángulos, sacadas de la misma matriz y de sus marginales.
+    """
+    p = glcm(img, levels, mask)
+    flat = p.reshape(4, -1)
+    contrast, dissimilarity, homogeneity, e_ij = _weights(levels).reshape(4, -1) @ flat.T
+    asm = np.einsum("ki,ki->k", flat, flat)
+
+    # La matriz es simétrica: las dos marginales (y sus momentos) son iguales
+    i = np.arange(levels, dtype=np.float64)
+    px = p.sum(axis=2)
+    mu = px @ i
+    var = px @ (i**2) - mu**2
+    # Como graycoprops: correlación 1 si alguna varianza es ~0
+    ok = var >= 1e-30
+    corr = np.ones(4)
+    corr[ok] = (e_ij[ok] - mu[ok] ** 2) / var[ok]
+
+    return {
+        "contrast": float(contrast.mean()),
+        "dissimilarity": float(dissimilarity.mean()),
+        "homogeneity": float(homogeneity.mean()),
+        "energy": float(np.sqrt(asm).mean()),
+        "correlation": float(corr.mean()),
+        "asm": float(asm.mean()),
+    }
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from image_processing.features import extract_features
+from image_processing.preprocess import PREP_SIZE, create_clahe
+from image_processing.segmentation import (
+    MORPH_KERNEL,
+    SEGMENTATION_METHOD,
+    segment_lungs,
+    threshold_from_histogram,
+)
+from utils.lru import ByteLRUCache
+
+# Subir la versión si cambia preprocess/segmentación/features: invalida la caché
+PIPELINE_VERSION = 4
+# Tope de la caché de resultados del pipeline (MB, configurable con PIPELINE_CACHE_MB)
+PIPELINE_CACHE_MB = int(os.environ.get("PIPELINE_CACHE_MB", "128"))
+
+
+@dataclass(frozen=True)
+class PipelineResult:
+    img: np.ndarray  # imagen original en grises
+    img_prep: np.ndarray
+    mask: np.ndarray
+    img_roi: np.ndarray
+    features: Optional[Dict[str, float]]  # None si la ROI quedó vacía
+
+    @property
+    def nbytes(self) -> int:
+        return self.img.nbytes + self.img_prep.nbytes + self.mask.nbytes + self.img_roi.nbytes
+
+
+def content_hash(data: bytes) -> str:
+    """Hash del contenido del archivo (el mismo que usa diagnosis para la vista previa)."""
+    return hashlib.md5(data).hexdigest()
+
+
+class PipelineContext:
+    """
+    Preproceso, segmentación, ROI y features con el CLAHE, el kernel y los
+    buffers intermedios armados una sola vez; por llamada solo se reservan los
+    arrays del resultado (img_prep, mask, img_roi). No es thread-safe: cada
+    hilo/worker usa su propio contexto (run_pipeline ya lo hace).
+    """
+
+    def __init__(self, size: Tuple[int, int] = PREP_SIZE, method: str = SEGMENTATION_METHOD):
+        self.size = size
+        self.method = method
+        self._clahe = create_clahe()
+        shape = (size[1], size[0])
+        self._resized = np.empty(shape, dtype=np.uint8)
+        self._labels = np.empty(shape, dtype=np.uint8)
+        self._binned = np.empty(shape, dtype=np.uint8)
+
+    def run(self, img: np.ndarray) -> PipelineResult:
+        """Lo mismo que preprocess_rx + segment_lungs + extract_features sobre `img` (2D uint8)."""
+        img = np.asarray(img)
+        if img.ndim != 2 or img.dtype != np.uint8:
+            raise ValueError("PipelineContext.run espera imagen 2D uint8 (grayscale).")
+        # Si OpenCV no puede escribir en el buffer reserva otro: se usa lo que devuelve
+        resized = cv2.resize(img, self.size, dst=self._resized, interpolation=cv2.INTER_AREA)
+        img_prep = self._clahe.apply(resized)
+
+        if self.method == "histogram":
+            hist = cv2.calcHist([img_prep], [0], None, [256], [0, 256])
+            t = threshold_from_histogram(hist)
+            if t is None:
+                self._labels.fill(0)
+            else:
+                cv2.compare(img_prep, t, cv2.CMP_LE, dst=self._labels)
+            mask = cv2.morphologyEx(self._labels, cv2.MORPH_OPEN, MORPH_KERNEL)
+        else:
+            mask = segment_lungs(img_prep, self.method)
+
+        # mask es 0/255: el AND deja los pixeles de la ROI y pone el resto en 0
+        img_roi = cv2.bitwise_and(img_prep, mask)
+        return PipelineResult(img, img_prep, mask, img_roi, extract_features(img_roi, out=self._binned))
+
+
+_LOCAL = threading.local()
+
+
+def pipeline_context() -> PipelineContext:
+    """El PipelineContext del hilo actual (se crea en el primer uso)."""
+    ctx = getattr(_LOCAL, "context", None)
+    if ctx is None:
+        ctx = _LOCAL.context = PipelineContext()
+    return ctx
+
+
+def run_pipeline(img: np.ndarray) -> PipelineResult:
+    """Preproceso, segmentación, ROI y features de una imagen 2D uint8."""
+    return pipeline_context().run(img)
+
+
+class PipelineCache(ByteLRUCache[PipelineResult]):
+    """
+    Caché LRU de PipelineResult por (hash del contenido, PIPELINE_VERSION),
+    compartida por todas las sesiones del proceso y acotada en bytes. Los
+    arrays quedan de solo lectura.
+    """
+
+    def get(self, key: str, load: Callable[[], np.ndarray]) -> PipelineResult:
+        """
+        Resultado para el contenido `key`; si no está, corre el pipeline sobre
+        `load()`. La caché se queda con el array que devuelve `load` y lo deja de
+        solo lectura: tiene que ser nuevo (si es del que llama, pasar una copia).
+        Cada llamada recibe su propio dict de features.
+        """
+
+        def run() -> PipelineResult:
+            result = run_pipeline(load())
+            for arr in (result.img, result.img_prep, result.mask, result.img_roi):
+                arr.setflags(write=False)
+            return result
+
+        result = self.get_or_load((key, PIPELINE_VERSION), run)
+        if result.features is None:
+            return result
+        return replace(result, features=dict(result.features))
+
+
+PIPELINE_CACHE = PipelineCache(PIPELINE_CACHE_MB << 20)
@@ -2,8 +2,18 @@ from typing import Tuple
 import cv2
 import numpy as np
 
+# Tamaño al que se lleva toda radiografía antes de segmentar (ancho, alto)
+PREP_SIZE = (512, 512)
+# Parámetros de CLAHE (también los usa PipelineContext, que guarda la instancia)
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
 
-def preprocess_rx(img: np.ndarray, size: Tuple[int, int] = (512, 512)) -> np.ndarray:
+
+def create_clahe():
+    return cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+
+
+def preprocess_rx(img: np.ndarray, size: Tuple[int, int] = PREP_SIZE) -> np.ndarray:
     img_resized = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    clahe = create_clahe()
     return clahe.apply(img_resized)
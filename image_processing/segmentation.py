@@ -1,8 +1,16 @@
+from typing import Optional
+
 import cv2
 import numpy as np
 
+# "histogram": k-means 1-D con k=2 resuelto exacto sobre el histograma (determinístico)
+# "kmeans": cv2.kmeans sobre todos los pixeles (centros al azar, 10 intentos)
+SEGMENTATION_METHOD = "histogram"
+# Elemento estructurante de la apertura que limpia la máscara
+MORPH_KERNEL = np.ones((5, 5), np.uint8)
+
 
-def segment_lungs(img: np.ndarray) -> np.ndarray:
+def _kmeans_labels(img: np.ndarray) -> np.ndarray:
     pixel_values = img.reshape((-1, 1)).astype(np.float32)
 
     criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
@@ -15,9 +23,58 @@ def segment_lungs(img: np.ndarray) -> np.ndarray:
     mask = centers[labels.flatten()].reshape(img.shape)
 
     th = float(np.mean(centers))
-    binary_mask = (mask < th).astype(np.uint8) * 255
+    return (mask < th).astype(np.uint8) * 255
+
+
+def dark_cluster_threshold(img: np.ndarray) -> Optional[int]:
+    """
+    Umbral t del k-means 1-D con k=2 sobre una imagen uint8: el cluster oscuro
+    son los pixeles <= t. En 1-D los dos clusters óptimos son un corte del rango
+    de valores, así que se prueban los 255 cortes con sumas acumuladas del
+    histograma (mínima suma de cuadrados dentro de cada cluster, como Otsu).
+    None si no hay dos clusters distintos (como con cv2.kmeans, la máscara queda vacía).
+    """
+    return threshold_from_histogram(np.bincount(img.ravel(), minlength=256))
+
+
+def threshold_from_histogram(hist: np.ndarray) -> Optional[int]:
+    """dark_cluster_threshold a partir de las cuentas de 0..255."""
+    hist = np.asarray(hist, dtype=np.float64).ravel()
+    values = np.arange(256, dtype=np.float64)
+    w0 = np.cumsum(hist)[:-1]
+    s0 = np.cumsum(hist * values)[:-1]
+    w1 = hist.sum() - w0
+    s1 = float(np.dot(hist, values)) - s0
+
+    valid = (w0 > 0) & (w1 > 0)
+    if not valid.any():
+        return None
+    # SSE = sum(x^2) - s0^2/w0 - s1^2/w1: se maximiza lo que se resta
+    score = np.full(255, -np.inf)
+    score[valid] = s0[valid] ** 2 / w0[valid] + s1[valid] ** 2 / w1[valid]
+    t = int(np.argmax(score))
+
+    # Mismo criterio que con cv2.kmeans: centros truncados a uint8
+    if np.uint8(s0[t] / w0[t]) >= np.uint8(s1[t] / w1[t]):
+        return None
+    return t
+
+
+def _histogram_labels(img: np.ndarray) -> np.ndarray:
+    t = dark_cluster_threshold(img)
+    if t is None:
+        return np.zeros(img.shape, dtype=np.uint8)
+    return (img <= t).astype(np.uint8) * 255
+
+
+def segment_lungs(img: np.ndarray, method: str = SEGMENTATION_METHOD) -> np.ndarray:
+    if method == "histogram" and img.dtype == np.uint8:
+        binary_mask = _histogram_labels(img)
+    elif method in ("histogram", "kmeans"):
+        binary_mask = _kmeans_labels(img)
+    else:
+        raise ValueError(f"Método de segmentación desconocido: {method!r}.")
 
-    kernel = np.ones((5, 5), np.uint8)
-    binary_mask = cv2.morphologyEx(binary_mask, cv2.MORPH_OPEN, kernel)
+    binary_mask = cv2.morphologyEx(binary_mask, cv2.MORPH_OPEN, MORPH_KERNEL)
 
     return binary_mask
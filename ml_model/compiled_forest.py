@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import weakref
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from sklearn.ensemble._forest import ForestClassifier
+
+# Niveles que se bajan entre compactaciones de los pares que ya llegaron a una hoja
+_COMPACT_EVERY = 4
+
+# Random Forest "aplanado": los nodos de todos los árboles en arrays contiguos
+# (feature, umbral, hijos, probabilidades de hoja) y un recorrido vectorizado de
+# todos los árboles a la vez, sin DataFrame ni validación de sklearn por llamada.
+# Da exactamente lo mismo que clf.predict_proba con n_jobs=None: X en float32,
+# X[f] <= umbral, los NaN al hijo que dice tree_.missing_go_to_left, las mismas
+# probabilidades de hoja que DecisionTreeClassifier y suma de los árboles en
+# orden antes de dividir por la cantidad.
+
+
+class CompiledForest:
+    def __init__(self, clf):
+        # Solo bosques (RandomForest/ExtraTrees): AdaBoost o Bagging también tienen
+        # estimators_ de árboles pero no promedian igual sus probabilidades
+        if not isinstance(clf, ForestClassifier):
+            raise ValueError("CompiledForest necesita un RandomForestClassifier o ExtraTreesClassifier.")
+        estimators = getattr(clf, "estimators_", None)
+        if not estimators or getattr(clf, "n_outputs_", 1) != 1 or not hasattr(clf, "classes_"):
+            raise ValueError("CompiledForest necesita un RandomForestClassifier entrenado de una sola salida.")
+
+        self.classes_ = np.asarray(clf.classes_)
+        self.n_classes = len(self.classes_)
+        self.feature_names_in_ = getattr(clf, "feature_names_in_", None)
+        self.n_features = int(clf.n_features_in_)
+
+        features, thresholds, left, right, values, roots = [], [], [], [], [], []
+        # sklearn >= 1.3 guarda para cada nodo a qué hijo van los NaN (si en el
+        # entrenamiento no hubo NaN, al que recibió más muestras); antes no los aceptaba
+        missing = [] if all(hasattr(e.tree_, "missing_go_to_left") for e in estimators) else None
+        offset = depth = 0
+        for est in estimators:
+            tree = est.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            idx = np.arange(offset, offset + n)
+            # Las hojas apuntan a sí mismas: seguir bajando no las mueve
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, idx, tree.children_left + offset))
+            right.append(np.where(is_leaf, idx, tree.children_right + offset))
+            if missing is not None:
+                missing.append(~is_leaf & (np.asarray(tree.missing_go_to_left) != 0))
+
+            values.append(_leaf_proba(tree.value[:, 0, : self.n_classes]))
+
+            roots.append(offset)
+            offset += n
+            depth = max(depth, int(tree.max_depth))
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds).astype(np.float64)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.value = np.concatenate(values)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.is_leaf = self.left == np.arange(offset)
+        self.missing_left = np.concatenate(missing) if missing is not None else None
+        # children[2 * nodo + (va a la izquierda)]
+        self.children = np.stack([self.right, self.left], axis=1).ravel()
+        self.max_depth = depth
+
+    @property
+    def supports_missing(self) -> bool:
+        return self.missing_left is not None
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Nodo hoja (índice global) de cada árbol para cada muestra: (n_árboles, n_muestras)."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Se esperaban muestras de {self.n_features} features.")
+        n = X.shape[0]
+        flat = X.ravel()
+        has_nan = bool(np.isnan(flat).any())
+        if has_nan and self.missing_left is None:
+            raise ValueError("Este modelo no admite features NaN.")
+        out = np.repeat(self.roots, n)
+        # Pares (árbol, muestra) que todavía no llegaron a una hoja; en cada nivel
+        # se bajan todos juntos
+        active = np.flatnonzero(~self.is_leaf[out])
+        node = out[active]
+        base = (active % n) * self.n_features
+        level = 0
+        while active.size:
+            x = flat[base + self.feature[node]]
+            go_left = x <= self.threshold[node]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[node]
+            node = self.children[2 * node + go_left]
+            level += 1
+            # Las hojas apuntan a sí mismas: alcanza con sacar las terminadas cada tanto
+            if level % _COMPACT_EVERY == 0 or level >= self.max_depth:
+                done = self.is_leaf[node]
+                out[active[done]] = node[done]
+                keep = ~done
+                active, node, base = active[keep], node[keep], base[keep]
+        return out.reshape(self.n_trees, n)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        # (árboles, n, clases) sumado sobre el eje 0: fila por fila, en el orden de los árboles
+        proba = self.value[self.leaves(X)].sum(axis=0)
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def vector(self, features: Dict[str, float], feature_names: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Fila (1, n_features) en el orden del modelo; las features que falten van en 0."""
+        names = feature_names if feature_names is not None else self.feature_names_in_
+        if names is None:
+            return np.asarray([list(features.values())], dtype=np.float32)
+        return np.asarray([[features.get(n, 0.0) for n in names]], dtype=np.float32)
+
+
+def _leaf_proba(value: np.ndarray) -> np.ndarray:
+    # sklearn >= 1.4 guarda en tree_.value las fracciones por clase y las usa tal
+    # cual; antes guardaba cuentas y predict_proba las normalizaba
+    value = value.astype(np.float64)
+    totals = value.sum(axis=1)
+    if np.allclose(totals[totals > 0], 1.0):
+        return value
+    normalizer = totals[:, np.newaxis]
+    normalizer[normalizer == 0.0] = 1.0
+    return value / normalizer
+
+
+_COMPILED: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def compile_forest(clf) -> Optional[CompiledForest]:
+    """
+    El CompiledForest de `clf` (se arma una vez por modelo cargado), o None si
+    el modelo no es un RandomForest/ExtraTrees de clasificación de una salida
+    (se usa sklearn).
+    """
+    try:
+        return _COMPILED[clf]
+    except KeyError:
+        pass
+    except TypeError:
+        return None
+    try:
+        compiled = CompiledForest(clf)
+    except (ValueError, AttributeError):
+        compiled = None
+    _COMPILED[clf] = compiled
+    return compiled
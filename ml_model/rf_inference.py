@@ -1,17 +1,24 @@
 from __future__ import annotations
 
+import io
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import cv2
 import joblib
 import numpy as np
 import pandas as pd
+from PIL import Image
 
-from image_processing.preprocess import preprocess_rx
-from image_processing.segmentation import segment_lungs
-from image_processing.features import extract_features
+from compression.huffman_codec import decompress_huf_file_to_image
+from image_processing.pipeline import PIPELINE_CACHE, PipelineResult, content_hash, run_pipeline
+from image_processing.preprocess import PREP_SIZE
+from ml_model.compiled_forest import compile_forest
 
 # Diccionario de clases
 CLASES: Dict[int, str] = {
@@ -26,6 +33,17 @@ CLASES: Dict[int, str] = {
     8: "Alteraciones Tórax",
 }
 
+# Reducciones que libjpeg hace al decodificar (escalando en el dominio DCT)
+_JPEG_REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+}
+# Tamaño mínimo al que el pipeline decodifica los JPEG: el doble de PREP_SIZE, así
+# el resize por área sigue promediando (reducir hasta PREP_SIZE mueve las features
+# de textura hasta ~10%; con este margen, ~2-3%; ver scripts/check_reduced_decode)
+DECODE_MIN_SIZE = (2 * PREP_SIZE[0], 2 * PREP_SIZE[1])
+
 
 @dataclass(frozen=True)
 class RFResult:
@@ -38,34 +56,91 @@ class RFResult:
     img_prep: np.ndarray
     mask: np.ndarray
     img_roi: np.ndarray
+    features: Dict[str, float]
 
 
 def load_rf_model(model_path: Path):
     return joblib.load(str(model_path))
 
 
-def predict_from_image_path_with_model(image_path: Path, clf) -> RFResult:
-    img = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+def jpeg_reduction(size: Tuple[int, int], min_size: Tuple[int, int]) -> int:
+    """
+    Mayor factor 8/4/2 con el que un JPEG de `size` (ancho, alto) decodificado
+    reducido sigue midiendo al menos `min_size`; 1 si no se puede reducir.
+    """
+    (w, h), (min_w, min_h) = size, min_size
+    for k in sorted(_JPEG_REDUCED_FLAGS, reverse=True):
+        if -(-w // k) >= min_w and -(-h // k) >= min_h:
+            return k
+    return 1
+
+
+def _imread_flag(header, min_size: Optional[Tuple[int, int]]) -> int:
+    # Solo se mira el encabezado (PIL no decodifica hasta que se piden los pixeles)
+    if min_size is None:
+        return cv2.IMREAD_GRAYSCALE
+    try:
+        with Image.open(header) as im:
+            if im.format != "JPEG":
+                return cv2.IMREAD_GRAYSCALE
+            k = jpeg_reduction(im.size, min_size)
+    except OSError:
+        return cv2.IMREAD_GRAYSCALE
+    return _JPEG_REDUCED_FLAGS.get(k, cv2.IMREAD_GRAYSCALE)
+
+
+def load_gray_image(image_path: Path, min_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Lee la imagen en escala de grises (uint8). Los .huf se decodifican directo
+    (los de 12/16 bits se llevan a 8 bits), el resto va por cv2.imread. Con
+    `min_size` (ancho, alto) los JPEG se decodifican reducidos 2/4/8 veces
+    mientras sigan midiendo al menos eso (el pipeline usa DECODE_MIN_SIZE).
+    """
+    image_path = Path(image_path)
+    if image_path.suffix.lower() == ".huf":
+        return _to_uint8(decompress_huf_file_to_image(image_path))
+
+    img = cv2.imread(str(image_path), _imread_flag(image_path, min_size))
     if img is None:
         raise ValueError(f"No se pudo leer la imagen: {image_path}")
+    return img
+
+
+def decode_gray_image_bytes(data: bytes, min_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """Como load_gray_image para un JPG/PNG ya leído (p. ej. el archivo subido)."""
+    flag = _imread_flag(io.BytesIO(data), min_size)
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if img is None:
+        raise ValueError("No se pudo leer la imagen.")
+    return img
+
 
-    img_prep = preprocess_rx(img)
-    mask = segment_lungs(img_prep)
+def _to_uint8(img: np.ndarray) -> np.ndarray:
+    # Misma regla que cv2.imread con IMREAD_GRAYSCALE (byte alto): el estudio da igual
+    # desde su PNG de 16 bits que desde el .huf
+    if img.dtype == np.uint8:
+        return img
+    return (img >> 8).astype(np.uint8)
 
-    img_roi = img_prep.copy()
-    img_roi[mask == 0] = 0
 
-    feats = extract_features(img_roi)
-    if feats is None:
+def _predict_pipeline(pipe: PipelineResult, clf) -> RFResult:
+    if pipe.features is None:
         raise ValueError("La segmentación falló: ROI vacía.")
 
-    df = pd.DataFrame([feats])
+    forest = compile_forest(clf)
+    x = forest.vector(pipe.features) if forest is not None else None
+    if forest is not None and (forest.supports_missing or not np.isnan(x).any()):
+        # Un solo recorrido de los árboles, sin DataFrame (mismo resultado que sklearn)
+        proba = forest.predict_proba(x)[0]
+        pred_idx = int(forest.classes_[int(np.argmax(proba))])
+    else:
+        df = pd.DataFrame([pipe.features])
 
-    if hasattr(clf, "feature_names_in_"):
-        df = df.reindex(columns=list(clf.feature_names_in_), fill_value=0)
+        if hasattr(clf, "feature_names_in_"):
+            df = df.reindex(columns=list(clf.feature_names_in_), fill_value=0)
 
-    pred_idx = int(clf.predict(df)[0])
-    proba = clf.predict_proba(df)[0].astype(float)
+        pred_idx = int(clf.predict(df)[0])
+        proba = clf.predict_proba(df)[0].astype(float)
 
     label = CLASES.get(pred_idx, "Desconocido")
     score = float(proba[pred_idx])
@@ -79,13 +154,169 @@ def predict_from_image_path_with_model(image_path: Path, clf) -> RFResult:
         score=score,
         proba=proba,
         top3=top3,
-        img_original=img,
-        img_prep=img_prep,
-        mask=mask,
-        img_roi=img_roi,
+        img_original=pipe.img,
+        img_prep=pipe.img_prep,
+        mask=pipe.mask,
+        img_roi=pipe.img_roi,
+        features=pipe.features,
     )
 
 
+def predict_features_matrix(X: np.ndarray, feature_names: List[str], clf) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (pred_idx, proba) de muchos vectores de features ya calculados (p. ej. los
+    de database.db.load_study_features), sin pasar por las imágenes.
+    """
+    df = pd.DataFrame(np.asarray(X), columns=list(feature_names))
+    if hasattr(clf, "feature_names_in_"):
+        df = df.reindex(columns=list(clf.feature_names_in_), fill_value=0)
+    proba = clf.predict_proba(df).astype(float)
+    # Lo mismo que clf.predict: la clase de mayor probabilidad
+    pred_idx = np.asarray(clf.classes_).take(np.argmax(proba, axis=1)).astype(np.int64)
+    return pred_idx, proba
+
+
+def predict_from_array(img: np.ndarray, clf, content_key: Optional[str] = None) -> RFResult:
+    """
+    Corre el pipeline (preproceso, segmentación, features) y el modelo sobre una
+    imagen 2D ya cargada. Con `content_key` (p. ej. content_hash del archivo) el
+    pipeline pasa por PIPELINE_CACHE.
+    """
+    src = np.asarray(img)
+    if src.ndim != 2:
+        raise ValueError("predict_from_array espera imagen 2D (grayscale).")
+    img = _to_uint8(src)
+    if content_key is None:
+        return _predict_pipeline(run_pipeline(img), clf)
+    # La caché congela el array que guarda: si es el del que llama, va una copia
+    load = (lambda: img.copy()) if img is src else (lambda: img)
+    return _predict_pipeline(PIPELINE_CACHE.get(content_key, load), clf)
+
+
+def pipeline_for_file(image_path: Path) -> PipelineResult:
+    """Pipeline de un archivo por el hash de su contenido (si ya se corrió, no se decodifica ni se procesa de nuevo)."""
+    image_path = Path(image_path)
+    key = content_hash(image_path.read_bytes())
+    return PIPELINE_CACHE.get(key, lambda: load_gray_image(image_path, min_size=DECODE_MIN_SIZE))
+
+
+def predict_from_image_path_with_model(image_path: Path, clf) -> RFResult:
+    return _predict_pipeline(pipeline_for_file(image_path), clf)
+
+
 def predict_from_image_path(image_path: Path, model_path: Path) -> RFResult:
     clf = load_rf_model(model_path)
-    return predict_from_image_path_with_model(image_path, clf)
\ No newline at end of file
+    return predict_from_image_path_with_model(image_path, clf)
+
+# ---------------------------------------------------------------------
+# Extracción de features en lote (re-extraer el archivo cuando cambia el pipeline)
+# ---------------------------------------------------------------------
+
+BATCH_CHUNK_SIZE = 16
+
+ImageSource = Union[str, Path, np.ndarray]
+
+
+@dataclass(frozen=True)
+class BatchFeatures:
+    index: int  # posición en la entrada
+    source: str  # path, o "array[i]" para imágenes en memoria
+    features: Optional[Dict[str, float]]
+    error: Optional[str]  # None si salió bien
+
+
+@dataclass(frozen=True)
+class BatchProgress:
+    done: int
+    failed: int
+    total: Optional[int]  # None si la entrada no tiene len()
+    elapsed: float  # segundos
+
+    @property
+    def rate(self) -> float:
+        """Imágenes por segundo."""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def _features_of(index: int, item: ImageSource) -> BatchFeatures:
+    source = f"array[{index}]" if isinstance(item, np.ndarray) else str(item)
+    try:
+        if isinstance(item, np.ndarray):
+            if item.ndim != 2:
+                raise ValueError("se espera imagen 2D (grayscale)")
+            img = _to_uint8(item)
+        else:
+            img = load_gray_image(Path(item), min_size=DECODE_MIN_SIZE)
+        features = run_pipeline(img).features
+        if features is None:
+            return BatchFeatures(index, source, None, "La segmentación falló: ROI vacía.")
+        return BatchFeatures(index, source, features, None)
+    except Exception as e:
+        return BatchFeatures(index, source, None, f"{type(e).__name__}: {e}")
+
+
+def _features_chunk(chunk: List[Tuple[int, ImageSource]]) -> List[BatchFeatures]:
+    # Corre en el worker: vuelven solo los dicts de features, no las imágenes
+    return [_features_of(i, item) for i, item in chunk]
+
+
+def _chunked(it: Iterable, size: int) -> Iterator[list]:
+    it = iter(it)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def extract_features_batch(
+    items: Iterable[ImageSource],
+    workers: Optional[int] = None,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    progress: Optional[Callable[[BatchProgress], None]] = None,
+) -> Iterator[BatchFeatures]:
+    """
+    Features de muchas imágenes (paths a JPG/PNG/.huf o arrays 2D) en un pool
+    de procesos, de a `chunk_size` por tarea. Devuelve un BatchFeatures por
+    imagen a medida que terminan (no en orden: usar .index); las que fallan,
+    incluida la ROI vacía, vienen con `error` en lugar de cortar el lote.
+    Los paths se leen en el worker; los arrays viajan al worker, pero al
+    proceso principal solo vuelven las features. Hay a lo sumo 2 * workers
+    tareas en vuelo, así que `items` puede ser un generador largo.
+    `progress` se llama después de cada tarea. Con workers=1 corre en el proceso actual.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size debe ser >= 1.")
+    workers = workers or os.cpu_count() or 1
+    total = len(items) if hasattr(items, "__len__") else None
+    chunks = _chunked(enumerate(items), chunk_size)
+
+    t0 = time.perf_counter()
+    done = failed = 0
+
+    def report(results: List[BatchFeatures]):
+        nonlocal done, failed
+        done += len(results)
+        failed += sum(r.error is not None for r in results)
+        if progress is not None:
+            progress(BatchProgress(done, failed, total, time.perf_counter() - t0))
+
+    if workers == 1:
+        for chunk in chunks:
+            results = _features_chunk(chunk)
+            report(results)
+            yield from results
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for chunk in itertools.islice(chunks, 2 * workers):
+            pending.add(pool.submit(_features_chunk, chunk))
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results = future.result()
+                report(results)
+                yield from results
+                for chunk in itertools.islice(chunks, 1):
+                    pending.add(pool.submit(_features_chunk, chunk))
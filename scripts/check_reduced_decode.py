@@ -0,0 +1,80 @@
+"""
+Compara el pipeline con el JPEG decodificado completo y decodificado reducido
+(load_gray_image con min_size=DECODE_MIN_SIZE): factor usado, tiempos de lectura,
+diferencia de features y, si está el modelo, predicción y probabilidades.
+
+    python -m scripts.check_reduced_decode [--dir outputs/images] [--model ml_model/modelo_random_forest_final.pkl]
+
+Sale con código 1 si alguna predicción cambia.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from image_processing.pipeline import PipelineContext
+from ml_model.rf_inference import (
+    DECODE_MIN_SIZE,
+    _predict_pipeline,
+    jpeg_reduction,
+    load_gray_image,
+    load_rf_model,
+)
+
+JPEG_SUFFIXES = {".jpg", ".jpeg"}
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, 1000 * (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad del pipeline con decodificación JPEG reducida.")
+    parser.add_argument("--dir", type=Path, default=Path("outputs/images"))
+    parser.add_argument("--model", type=Path, default=Path("ml_model/modelo_random_forest_final.pkl"))
+    args = parser.parse_args()
+
+    clf = load_rf_model(args.model) if args.model.exists() else None
+    if clf is None:
+        print(f"No está el modelo ({args.model}): solo se comparan features.")
+
+    ctx = PipelineContext()
+    paths = sorted(p for p in args.dir.rglob("*") if p.suffix.lower() in JPEG_SUFFIXES)
+    changed = reduced = 0
+    worst = 0.0
+    for path in paths:
+        with Image.open(path) as im:
+            k = jpeg_reduction(im.size, DECODE_MIN_SIZE)
+        if k == 1:
+            continue
+        reduced += 1
+        full, t_full = _timed(load_gray_image, path)
+        small, t_small = _timed(load_gray_image, path, DECODE_MIN_SIZE)
+        pipes = [ctx.run(full), ctx.run(small)]
+        feats = [p.features for p in pipes]
+
+        line = f"{path.name}: {full.shape[1]}x{full.shape[0]} -> 1/{k} · lectura {t_full:.0f} -> {t_small:.0f} ms"
+        if all(feats):
+            diff = max(abs(feats[0][c] - feats[1][c]) / (abs(feats[0][c]) + 1e-9) for c in feats[0])
+            worst = max(worst, diff)
+            line += f" · máx. dif. relativa de features {diff:.4f}"
+        if clf is not None and all(feats):
+            res = [_predict_pipeline(p, clf) for p in pipes]
+            same = res[0].pred_idx == res[1].pred_idx
+            changed += not same
+            line += f" · predicción {'igual' if same else 'DISTINTA'} (máx. dif. proba {np.abs(res[0].proba - res[1].proba).max():.3f})"
+        print(line)
+
+    print(f"JPEG reducidos: {reduced}/{len(paths)} · peor dif. relativa de features {worst:.4f}")
+    if changed:
+        raise SystemExit(f"Cambió la predicción en {changed} imágenes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Verifica que el formato .huf decodifique exactamente lo que se codificó:
+cada codec registrado con cada predictor, en uint8, 12 bits y 16 bits, en
+memoria (encode_to_bytes), a archivo, por streaming y con la vista previa, y
+que se siga leyendo un .huf HUF1 escrito por la versión original (pickle).
+
+    python -m scripts.check_roundtrip
+
+Sale con código 1 si algún caso falla.
+"""
+from __future__ import annotations
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from compression.codecs import available_codecs
+from compression.huffman_codec import (
+    HufReader,
+    compress_image_to_huf_file,
+    compress_row_chunks_to_huf_file,
+    decode_from_buffer,
+    decompress_huf_file_to_image,
+    decompress_huf_preview,
+    encode_to_bytes,
+)
+from compression.prediction import PREDICTORS
+from compression.selection import AUTO
+
+# Escrito con compress_image_to_huf_file del código original (ver _huf1_image)
+HUF1_SAMPLE = Path(__file__).with_name("data") / "huf1_baseline.huf"
+
+
+def _huf1_image() -> np.ndarray:
+    r = np.arange(48)[:, None]
+    c = np.arange(64)[None, :]
+    return ((r * r * 3 + c * 7 + (r * c) // 5) % 251).astype(np.uint8)
+
+
+def _images():
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:150, 0:97]
+    smooth = (x * 2 + y + 10 * np.sin(x / 9.0)).astype(np.int64)
+    yield "uint8", (np.clip(smooth + rng.integers(0, 6, smooth.shape), 0, 255)).astype(np.uint8)
+    yield "uint12", (np.clip(smooth * 14 + rng.integers(0, 40, smooth.shape), 0, 4095)).astype(np.uint16)
+    yield "uint16", rng.integers(0, 1 << 16, (70, 33)).astype(np.uint16)
+    padded = np.zeros((130, 80), dtype=np.uint8)
+    padded[40:90, 20:60] = 200
+    yield "rle-friendly", padded
+    yield "1 row", np.arange(37, dtype=np.uint8)[None, :]
+    yield "constant", np.full((65, 3), 7, dtype=np.uint8)
+
+
+def main():
+    failures = []
+    cases = 0
+
+    def check(name: str, got: np.ndarray, img: np.ndarray):
+        nonlocal cases
+        cases += 1
+        if got.dtype != img.dtype or not np.array_equal(got, img):
+            failures.append(name)
+            print(f"  ✗ {name}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for label, img in _images():
+            for codec in available_codecs() + [AUTO]:
+                for predictor in PREDICTORS:
+                    name = f"{label} · {codec} · {predictor}"
+                    try:
+                        data = encode_to_bytes(img, codec=codec, predictor=predictor)
+                        check(f"{name} · bytes", decode_from_buffer(data), img)
+                        check(f"{name} · memoryview", decode_from_buffer(memoryview(data)), img)
+
+                        path = compress_row_chunks_to_huf_file(
+                            [img[i : i + 17] for i in range(0, img.shape[0], 17)],
+                            tmp / "stream.huf",
+                            predictor=predictor,
+                            codec=codec,
+                        )
+                        check(f"{name} · streaming", decompress_huf_file_to_image(path), img)
+                    except Exception as e:
+                        failures.append(name)
+                        print(f"  ✗ {name}: {type(e).__name__}: {e}")
+
+            path = compress_image_to_huf_file(img, tmp / "file.huf")
+            check(f"{label} · archivo", decompress_huf_file_to_image(path), img)
+            with HufReader(path) as reader:
+                check(f"{label} · HufReader.read_rows", reader.read_rows(0, img.shape[0]), img)
+                if reader.has_preview:
+                    preview = decompress_huf_preview(path)
+                    cases += 1
+                    if preview.ndim != 2 or preview.dtype != img.dtype:
+                        failures.append(f"{label} · preview")
+                        print(f"  ✗ {label} · preview")
+
+    check("HUF1 original", decompress_huf_file_to_image(HUF1_SAMPLE), _huf1_image())
+
+    print(f"{cases - len(failures)}/{cases} casos OK")
+    if failures:
+        raise SystemExit(f"Fallaron {len(failures)} casos.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compara la segmentación por histograma con la de cv2.kmeans (la original) en
+imágenes de muestra: acuerdo de pixeles, IoU de las máscaras, umbral y tiempos.
+
+    python -m scripts.check_segmentation [--dir notebooks/images_test] [--min-iou 0.97]
+
+Sale con código 1 si alguna imagen queda por debajo de --min-iou.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from image_processing.features import extract_features
+from image_processing.preprocess import preprocess_rx
+from image_processing.segmentation import dark_cluster_threshold, segment_lungs
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, 1000 * (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad de segment_lungs: histograma vs cv2.kmeans.")
+    parser.add_argument("--dir", type=Path, default=Path("notebooks/images_test"))
+    parser.add_argument("--min-iou", type=float, default=0.97)
+    args = parser.parse_args()
+
+    paths = sorted(p for p in args.dir.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    worst = 1.0
+    for path in paths:
+        img_prep = preprocess_rx(cv2.imread(str(path), cv2.IMREAD_GRAYSCALE))
+        ref, t_ref = _timed(segment_lungs, img_prep, "kmeans")
+        new, t_new = _timed(segment_lungs, img_prep, "histogram")
+
+        a, b = ref > 0, new > 0
+        union = np.count_nonzero(a | b)
+        iou = np.count_nonzero(a & b) / union if union else 1.0
+        worst = min(worst, iou)
+
+        feats = [extract_features(np.where(m > 0, img_prep, 0).astype(np.uint8)) for m in (ref, new)]
+        diff = (
+            max(abs(feats[0][k] - feats[1][k]) / (abs(feats[0][k]) + 1e-9) for k in feats[0])
+            if all(feats)
+            else float("nan")
+        )
+        print(
+            f"{path.name}: acuerdo {np.mean(a == b):.4f} · IoU {iou:.4f} · "
+            f"umbral {dark_cluster_threshold(img_prep)} · máx. dif. relativa de features {diff:.4f} · "
+            f"kmeans {t_ref:.0f} ms / histograma {t_new:.1f} ms"
+        )
+
+    if worst < args.min_iou:
+        raise SystemExit(f"IoU mínima {worst:.4f} < {args.min_iou}")
+
+
+if __name__ == "__main__":
+    main()
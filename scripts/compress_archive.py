@@ -0,0 +1,158 @@
+"""
+Comprime a .huf los estudios que todavía apuntan a un JPG/PNG (nunca se
+guardó el informe o falló la compresión) y actualiza image_path en la DB.
+
+    python -m scripts.compress_archive [--workers N] [--batch 50] [--remove-originals]
+
+Cada imagen se comprime en un proceso del pool, se verifica que el .huf
+decodifique exactamente igual y recién entonces se actualiza la DB, de a un
+lote por transacción. El checkpoint guarda los estudios que fallaron y los
+totales; si la corrida se corta, volver a ejecutar sigue con lo que falta
+(los estudios ya actualizados no vuelven a aparecer en la consulta).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from compression.huffman_codec import compress_image_to_huf_file, decompress_huf_file_to_image
+from database.db import init_db, list_uncompressed_studies, update_study_image_paths
+
+CHECKPOINT_PATH = Path("outputs/compress_archive_checkpoint.json")
+BATCH_SIZE = 50
+
+# (study_id, path .huf, bytes originales, bytes .huf, bytes de pixeles, error)
+Result = Tuple[int, Optional[str], int, int, int, Optional[str]]
+
+
+def _load_image(path: Path) -> np.ndarray:
+    # Misma conversión que diagnosis al guardar el informe (escala de grises 8 bits,
+    # también para PNG de 16 bits): el .huf del archivo y el de la app quedan iguales
+    with Image.open(path) as im:
+        return np.array(im.convert("L"), dtype=np.uint8)
+
+
+def _compress_one(study_id: int, image_path: str) -> Result:
+    src = Path(image_path)
+    try:
+        img = _load_image(src)
+        out = src.with_suffix(".huf")
+        tmp = out.with_name(out.name + ".tmp")
+        try:
+            compress_image_to_huf_file(img, tmp)
+            if not np.array_equal(decompress_huf_file_to_image(tmp), img):
+                raise ValueError("el .huf no decodifica igual a la imagen original")
+            os.replace(tmp, out)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return study_id, str(out), src.stat().st_size, out.stat().st_size, img.nbytes, None
+    except Exception as e:
+        return study_id, None, 0, 0, 0, f"{type(e).__name__}: {e}"
+
+
+def _load_checkpoint(path: Path) -> Dict[str, Any]:
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {"failed": {}, "done": 0, "bytes_in": 0, "bytes_out": 0, "bytes_raw": 0}
+
+
+def _save_checkpoint(path: Path, state: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _mb(n: int) -> float:
+    return n / (1 << 20)
+
+
+def run(
+    workers: int,
+    batch_size: int = BATCH_SIZE,
+    checkpoint: Path = CHECKPOINT_PATH,
+    retry_failed: bool = False,
+    remove_originals: bool = False,
+) -> Dict[str, Any]:
+    init_db()
+    state = _load_checkpoint(checkpoint)
+    if retry_failed:
+        state["failed"] = {}
+    skip = {int(k) for k in state["failed"]}
+    pending = [s for s in list_uncompressed_studies() if int(s["study_id"]) not in skip]
+    print(f"Estudios a comprimir: {len(pending)} (salteados por fallas previas: {len(skip)})")
+
+    t0 = time.perf_counter()
+    done = bytes_in = bytes_out = bytes_raw = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for b in range(0, len(pending), batch_size):
+            batch = pending[b : b + batch_size]
+            futures = [pool.submit(_compress_one, int(s["study_id"]), s["image_path"]) for s in batch]
+            results: List[Result] = [f.result() for f in as_completed(futures)]
+
+            ok = [r for r in results if r[5] is None]
+            update_study_image_paths([(r[0], r[1]) for r in ok])
+            if remove_originals:
+                originals = {int(s["study_id"]): Path(s["image_path"]) for s in batch}
+                for study_id, *_ in ok:
+                    originals[study_id].unlink(missing_ok=True)
+
+            for study_id, *_, error in results:
+                if error is not None:
+                    state["failed"][str(study_id)] = error
+                    print(f"  ✗ estudio #{study_id}: {error}")
+            done += len(ok)
+            bytes_in += sum(r[2] for r in ok)
+            bytes_out += sum(r[3] for r in ok)
+            bytes_raw += sum(r[4] for r in ok)
+            state["done"] += len(ok)
+            state["bytes_in"] += sum(r[2] for r in ok)
+            state["bytes_out"] += sum(r[3] for r in ok)
+            state["bytes_raw"] = state.get("bytes_raw", 0) + sum(r[4] for r in ok)
+            _save_checkpoint(checkpoint, state)
+
+            elapsed = time.perf_counter() - t0
+            print(
+                f"  {b + len(batch)}/{len(pending)} · {done / elapsed:.1f} img/s · "
+                f"{_mb(bytes_in) / elapsed:.1f} MB/s"
+            )
+
+    elapsed = time.perf_counter() - t0
+    saved = bytes_in - bytes_out
+    print(
+        f"Comprimidos: {done} en {elapsed:.1f} s "
+        f"({done / elapsed if elapsed else 0:.1f} img/s, {_mb(bytes_in) / elapsed if elapsed else 0:.1f} MB/s)"
+    )
+    print(
+        f"Espacio: {_mb(bytes_in):.1f} MB -> {_mb(bytes_out):.1f} MB "
+        f"(ahorro {_mb(saved):.1f} MB, {100 * saved / bytes_in if bytes_in else 0:.1f}%); "
+        f"pixeles sin comprimir: {_mb(bytes_raw):.1f} MB (ratio {bytes_raw / bytes_out if bytes_out else 0:.2f}x)"
+    )
+    if state["failed"]:
+        print(f"Fallaron {len(state['failed'])} estudios (ver {checkpoint}; --retry-failed para reintentar).")
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprime a .huf los estudios guardados como JPG/PNG.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="procesos del pool")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="estudios por transacción")
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_PATH)
+    parser.add_argument("--retry-failed", action="store_true", help="reintenta los que fallaron antes")
+    parser.add_argument(
+        "--remove-originals", action="store_true", help="borra el JPG/PNG después de actualizar la DB"
+    )
+    args = parser.parse_args()
+    run(args.workers, args.batch, args.checkpoint, args.retry_failed, args.remove_originals)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Re-extrae las features del pipeline para muchas imágenes con
+ml_model.rf_inference.extract_features_batch y las guarda en un CSV.
+
+    python -m scripts.extract_features --dir outputs/images --out features.csv [--workers N] [--chunk 16]
+    python -m scripts.extract_features --studies --out features.csv
+
+Con --studies usa las imágenes de todos los estudios de la DB (la columna
+study_id queda en el CSV). Las imágenes que fallan se listan al final.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from database.db import get_connection, init_db
+from ml_model.rf_inference import BATCH_CHUNK_SIZE, BatchProgress, extract_features_batch
+
+IMAGE_SUFFIXES = {".huf", ".jpg", ".jpeg", ".png"}
+
+
+def _print_progress(p: BatchProgress) -> None:
+    total = f"/{p.total}" if p.total is not None else ""
+    print(f"\r  {p.done}{total} · {p.failed} fallidas · {p.rate:.1f} img/s", end="", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extrae las features del pipeline en lote.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", type=Path, help="carpeta de imágenes")
+    source.add_argument("--studies", action="store_true", help="todos los estudios de la DB")
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=BATCH_CHUNK_SIZE, help="imágenes por tarea del pool")
+    args = parser.parse_args()
+
+    if args.studies:
+        init_db()
+        conn = get_connection()
+        rows = conn.execute("SELECT id, image_path FROM studies WHERE image_path IS NOT NULL ORDER BY id;").fetchall()
+        conn.close()
+        study_ids = [int(r["id"]) for r in rows]
+        paths = [r["image_path"] for r in rows]
+    else:
+        paths = sorted(str(p) for p in args.dir.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+        study_ids = None
+
+    records, failed = [], []
+    for r in extract_features_batch(paths, args.workers, args.chunk, _print_progress):
+        if r.error is not None:
+            failed.append(r)
+            continue
+        record = {"path": r.source, **r.features}
+        if study_ids is not None:
+            record = {"study_id": study_ids[r.index], **record}
+        records.append(record)
+    print()
+
+    df = pd.DataFrame(records)
+    if not df.empty:
+        df = df.sort_values("study_id" if study_ids is not None else "path")
+    df.to_csv(args.out, index=False)
+    print(f"{len(records)} filas en {args.out}")
+    for r in sorted(failed, key=lambda r: r.index):
+        print(f"  ✗ {r.source}: {r.error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Vuelve a puntuar los estudios con un modelo (p. ej. uno recién entrenado)
+usando las features guardadas en study_features, sin leer las imágenes.
+
+    python -m scripts.rescore_studies [--model ml_model/modelo_random_forest_final.pkl] [--backfill] [--dry-run]
+
+Solo se usan las features de la versión actual del pipeline (PIPELINE_VERSION).
+Con --backfill antes se extraen (extract_features_batch) las de los estudios
+que no las tienen. Con --dry-run solo se informa cuántas predicciones cambiarían.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from database.db import (
+    get_connection,
+    init_db,
+    load_study_features,
+    save_study_features_many,
+    update_study_ml_results,
+)
+from image_processing.pipeline import PIPELINE_VERSION
+from ml_model.rf_inference import CLASES, extract_features_batch, load_rf_model, predict_features_matrix
+
+MODEL_PATH = Path("ml_model/modelo_random_forest_final.pkl")
+
+
+def _backfill(workers: int) -> None:
+    conn = get_connection()
+    rows = conn.execute(
+        """
+        SELECT s.id, s.image_path
+        FROM studies s
+        LEFT JOIN study_features f ON f.study_id = s.id AND f.pipeline_version = ?
+        WHERE f.study_id IS NULL
+        ORDER BY s.id;
+        """,
+        (PIPELINE_VERSION,),
+    ).fetchall()
+    conn.close()
+    print(f"Estudios sin features (versión {PIPELINE_VERSION}): {len(rows)}")
+
+    saved, batch = 0, []
+    for r in extract_features_batch([row["image_path"] for row in rows], workers):
+        if r.error is not None:
+            print(f"  ✗ estudio #{rows[r.index]['id']}: {r.error}")
+            continue
+        batch.append((int(rows[r.index]["id"]), r.features))
+        if len(batch) >= 200:
+            save_study_features_many(batch, PIPELINE_VERSION)
+            saved, batch = saved + len(batch), []
+    save_study_features_many(batch, PIPELINE_VERSION)
+    print(f"Features guardadas: {saved + len(batch)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-puntúa los estudios con las features guardadas.")
+    parser.add_argument("--model", type=Path, default=MODEL_PATH)
+    parser.add_argument("--backfill", action="store_true", help="extrae las features que falten")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    init_db()
+    if args.backfill:
+        _backfill(args.workers)
+
+    clf = load_rf_model(args.model)
+    t0 = time.perf_counter()
+    study_ids, X, names = load_study_features(PIPELINE_VERSION)
+    t_load = time.perf_counter() - t0
+    if not study_ids:
+        print("No hay features guardadas para esta versión del pipeline (usar --backfill).")
+        return
+
+    t0 = time.perf_counter()
+    pred_idx, proba = predict_features_matrix(X, names, clf)
+    t_pred = time.perf_counter() - t0
+    updates = []
+    for study_id, idx, p in zip(study_ids, pred_idx, proba):
+        updates.append((study_id, CLASES.get(int(idx), "Desconocido"), float(p[int(idx)])))
+
+    conn = get_connection()
+    previous = {int(r["id"]): r["model_label"] for r in conn.execute("SELECT id, model_label FROM studies;")}
+    conn.close()
+    changed = sum(previous.get(study_id) != label for study_id, label, _ in updates)
+    print(
+        f"{len(updates)} estudios · carga {1000 * t_load:.0f} ms · predict_proba {1000 * t_pred:.0f} ms · "
+        f"cambia la etiqueta en {changed}"
+    )
+    if not args.dry_run:
+        update_study_ml_results(updates)
+        print("Resultados actualizados en la DB.")
+
+
+if __name__ == "__main__":
+    main()
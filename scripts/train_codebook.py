@@ -0,0 +1,87 @@
+"""
+Entrena una tabla de Huffman compartida (compression.codebooks) con una muestra
+de estudios y la agrega a compression/codebooks.json con un id nuevo.
+
+    python -m scripts.train_codebook --name rx_med_v1 [--sample 200] [--dir outputs/images]
+
+Sin --dir usa las imágenes de los estudios de la DB (.huf o JPG/PNG). Los ids
+ya publicados no se tocan: los .huf que los referencian dependen de esas tablas.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+from compression.codebooks import CODEBOOKS_PATH, available_codebooks, save_codebooks, train_codebook
+from compression.codecs import HuffmanCodec
+from compression.huffman_codec import DEFAULT_PREDICTOR, decompress_huf_file_to_image
+from compression.huffman_core import histograma
+from compression.prediction import residuals
+from database.db import get_connection, init_db
+
+IMAGE_SUFFIXES = {".huf", ".jpg", ".jpeg", ".png"}
+
+
+def _load_image(path: Path) -> np.ndarray:
+    if path.suffix.lower() == ".huf":
+        return decompress_huf_file_to_image(path)
+    with Image.open(path) as im:
+        return np.array(im.convert("L"), dtype=np.uint8)
+
+
+def _study_paths() -> List[Path]:
+    init_db()
+    conn = get_connection()
+    rows = conn.execute("SELECT image_path FROM studies ORDER BY id;").fetchall()
+    conn.close()
+    return [Path(r["image_path"]) for r in rows if r["image_path"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena un codebook de Huffman con una muestra de estudios.")
+    parser.add_argument("--name", required=True)
+    parser.add_argument("--dir", type=Path, help="carpeta de imágenes (por defecto, los estudios de la DB)")
+    parser.add_argument("--sample", type=int, default=200, help="cantidad de imágenes a usar")
+    parser.add_argument("--predictor", default=DEFAULT_PREDICTOR)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=CODEBOOKS_PATH)
+    args = parser.parse_args()
+
+    if args.dir:
+        paths = sorted(p for p in args.dir.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    else:
+        paths = _study_paths()
+    paths = [p for p in paths if p.exists()]
+    random.Random(args.seed).shuffle(paths)
+    images = [img for img in map(_load_image, paths[: args.sample]) if img.dtype == np.uint8]
+    if not images:
+        raise SystemExit("No hay imágenes de 8 bits para entrenar.")
+
+    existing = available_codebooks()
+    new_id = max((c.codebook_id for c in existing), default=0) + 1
+    codebook = train_codebook(new_id, args.name, images, args.predictor)
+
+    # Cuánto habría costado la muestra con su tabla propia y con el codebook
+    own = shared = used = 0
+    for img in images:
+        hist = histograma(residuals(img, args.predictor, 0, 8))
+        own_model = HuffmanCodec(codebooks=False).fit_histogram(hist)
+        own_bits = int(np.dot(hist, own_model[1])) + 8 * len(HuffmanCodec().model_chunks(own_model)[0][1])
+        cb_bits = codebook.cost_bits(hist)
+        own += own_bits
+        shared += min(own_bits, cb_bits + 16)
+        used += cb_bits + 16 < own_bits
+    print(f"Codebook {new_id} ({args.name}) entrenado con {len(images)} imágenes.")
+    print(f"Lo elegirían {used}/{len(images)}; payload+tabla: {own / 8e3:.1f} kB -> {shared / 8e3:.1f} kB")
+
+    save_codebooks(existing + [codebook], args.out)
+    print(f"Guardado en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, TypeVar
+
+V = TypeVar("V")
+
+
+class ByteLRUCache(Generic[V]):
+    """
+    Caché LRU thread-safe acotada en bytes, para compartir resultados entre
+    todas las sesiones del proceso. Cada valor mide `size(valor)` bytes (por
+    defecto su .nbytes); se desalojan los menos usados cuando el total pasa
+    de `max_bytes`, y un valor más grande que eso se devuelve sin guardarlo.
+    """
+
+    def __init__(self, max_bytes: int, size: Callable[[V], int] = lambda v: v.nbytes):
+        self.max_bytes = max_bytes
+        self._size = size
+        self._items: "OrderedDict[Hashable, V]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key: Hashable, load: Callable[[], V]) -> V:
+        """Valor de `key`, o `load()` si no está (se guarda para la próxima)."""
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        # Se carga fuera del lock (dos sesiones pueden cargar lo mismo a la vez)
+        value = load()
+        nbytes = self._size(value)
+        if nbytes > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._items:
+                return self._items[key]
+            self._items[key] = value
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self.nbytes -= self._size(old)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self) -> None:
+        """Vacía la caché y pone los contadores en cero."""
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+            self.hits = self.misses = self.evictions = 0